@@ -1,7 +1,16 @@
 """API Call Agent - makes HTTP requests to external APIs."""
+import re
 import time
-import json
+import httpx
+from app import jsonutil
 from app.agents.base import BaseAgent, AgentResult
+from app.agents.clients import CLIENT, get_async_client
+
+
+SUPPORTED_METHODS = ("GET", "POST", "PUT", "DELETE")
+
+# {{key}} placeholders; keys may be node ids such as "node-3"
+_INTERP_RE = re.compile(r"\{\{([^{}]+)\}\}")
 
 
 class APICallAgent(BaseAgent):
@@ -10,6 +19,30 @@ class APICallAgent(BaseAgent):
 
     def run(self, objective: str, context: dict | None = None) -> AgentResult:
         start = time.time()
+        method, url, request_kwargs = self._prepare(context)
+        if method not in SUPPORTED_METHODS:
+            return AgentResult(success=False, output=f"Unsupported method: {method}")
+
+        try:
+            resp = CLIENT.request(method, url, **request_kwargs)
+            return self._to_result(resp, method, url, start)
+        except Exception as e:
+            return self._error_result(e, start)
+
+    async def arun(self, objective: str, context: dict | None = None) -> AgentResult:
+        start = time.time()
+        method, url, request_kwargs = self._prepare(context)
+        if method not in SUPPORTED_METHODS:
+            return AgentResult(success=False, output=f"Unsupported method: {method}")
+
+        try:
+            resp = await get_async_client().request(method, url, **request_kwargs)
+            return self._to_result(resp, method, url, start)
+        except Exception as e:
+            return self._error_result(e, start)
+
+    def _prepare(self, context: dict | None) -> tuple[str, str, dict]:
+        """Resolve method, URL and request kwargs from config + context."""
         url = self.config.get("url", "")
         method = self.config.get("method", "GET").upper()
         headers = self.config.get("headers", {})
@@ -21,42 +54,41 @@ class APICallAgent(BaseAgent):
             url = self._interpolate(url, context)
             if body and isinstance(body, str):
                 body = self._interpolate(body, context)
-            for k, v in headers.items():
-                headers[k] = self._interpolate(v, context)
+            headers = {k: self._interpolate(v, context) for k, v in headers.items()}
 
-        try:
-            import httpx
-            with httpx.Client(timeout=timeout_sec) as client:
-                if method == "GET":
-                    resp = client.get(url, headers=headers)
-                elif method == "POST":
-                    resp = client.post(url, headers=headers, content=body)
-                elif method == "PUT":
-                    resp = client.put(url, headers=headers, content=body)
-                elif method == "DELETE":
-                    resp = client.delete(url, headers=headers)
-                else:
-                    return AgentResult(success=False, output=f"Unsupported method: {method}")
+        return method, url, {
+            "headers": headers,
+            "content": body if method in ("POST", "PUT") else None,
+            "timeout": timeout_sec,
+        }
 
+    def _to_result(self, resp: httpx.Response, method: str, url: str, start: float) -> AgentResult:
+        # Only attempt a parse when the server says it's JSON
+        if "json" in resp.headers.get("content-type", ""):
             try:
-                output = resp.json()
-            except (json.JSONDecodeError, ValueError):
+                output = jsonutil.loads(resp.content)
+            except ValueError:
                 output = resp.text
+        else:
+            output = resp.text
 
-            return AgentResult(
-                success=resp.status_code < 400,
-                output=output,
-                duration_ms=int((time.time() - start) * 1000),
-                metadata={"status_code": resp.status_code, "url": url, "method": method},
-            )
-        except Exception as e:
-            return AgentResult(
-                success=False,
-                output=f"API call failed: {str(e)}",
-                duration_ms=int((time.time() - start) * 1000),
-            )
+        return AgentResult(
+            success=resp.status_code < 400,
+            output=output,
+            duration_ms=int((time.time() - start) * 1000),
+            metadata={"status_code": resp.status_code, "url": url, "method": method},
+        )
+
+    def _error_result(self, e: Exception, start: float) -> AgentResult:
+        return AgentResult(
+            success=False,
+            output=f"API call failed: {str(e)}",
+            duration_ms=int((time.time() - start) * 1000),
+        )
 
     def _interpolate(self, template: str, context: dict) -> str:
-        for key, value in context.items():
-            template = template.replace(f"{{{{{key}}}}}", str(value))
-        return template
+        """Substitute {{key}} placeholders in one pass; unknown keys are left as-is."""
+        return _INTERP_RE.sub(
+            lambda m: str(context[m.group(1)]) if m.group(1) in context else m.group(0),
+            template,
+        )
@@ -1,10 +1,11 @@
 """Base agent interface - all agents implement this contract."""
+import asyncio
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 from typing import Any
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentResult:
     """Standardized result from any agent execution."""
     success: bool
@@ -14,15 +15,21 @@ class AgentResult:
     duration_ms: int = 0
     metadata: dict = field(default_factory=dict)
 
+    def to_dict(self) -> dict:
+        """Deep-copied plain dict, for persisting a result rather than passing it along."""
+        return asdict(self)
+
 
 class BaseAgent(ABC):
     """Abstract base for all agents in the system."""
     name: str = "base"
     description: str = "Base agent"
 
-    def __init__(self, config: dict | None = None, tools: dict | None = None):
+    def __init__(self, config: dict | None = None, tools: dict | None = None, owner_id: str | None = None):
         self.config = config or {}
         self.tools = tools or {}
+        # The user the agent runs for; state shared across runs (e.g. the LLM response cache) is scoped by it
+        self.owner_id = owner_id
 
     @abstractmethod
     def run(self, objective: str, context: dict | None = None) -> AgentResult:
@@ -36,3 +43,19 @@ class BaseAgent(ABC):
             AgentResult with output and metadata
         """
         ...
+
+    async def arun(self, objective: str, context: dict | None = None) -> AgentResult:
+        """Async variant of run() so independent nodes can be awaited concurrently.
+
+        Agents with native async I/O override this; the default runs the
+        blocking run() in a worker thread.
+        """
+        return await asyncio.to_thread(self.run, objective, context)
+
+    def batch_run(self, objectives: list[str], context: dict | None = None) -> list[AgentResult]:
+        """Run several independent objectives with shared context; serial by default."""
+        return [self.run(objective, context) for objective in objectives]
+
+    async def abatch_run(self, objectives: list[str], context: dict | None = None) -> list[AgentResult]:
+        """Fan independent objectives out concurrently over arun()."""
+        return list(await asyncio.gather(*(self.arun(objective, context) for objective in objectives)))
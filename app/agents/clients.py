@@ -0,0 +1,32 @@
+"""Shared HTTP clients - pooled connections reused across agent runs."""
+import asyncio
+import atexit
+import weakref
+import httpx
+
+
+_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
+# Process-wide sync client so repeated calls to the same host skip TCP+TLS setup
+CLIENT = httpx.Client(timeout=30.0, http2=True, limits=_LIMITS)
+atexit.register(CLIENT.close)
+
+# An AsyncClient's pool is bound to the event loop that first used it, so keep one per loop
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the pooled AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=30.0, http2=True, limits=_LIMITS)
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+async def close_async_client() -> None:
+    """Close the running loop's AsyncClient (call before a short-lived loop exits)."""
+    client = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
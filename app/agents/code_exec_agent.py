@@ -1,9 +1,55 @@
 """Code Execution Agent - runs Python code in a sandboxed environment."""
+import atexit
+import multiprocessing
+import os
+import threading
 import time
-import sys
-import io
-import traceback
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
 from app.agents.base import BaseAgent, AgentResult
+from app.agents import code_exec_worker
+
+
+# Warm workers, started on first use and reused: user code runs off the server's GIL
+# and outside its address space, without paying interpreter startup per call.
+_POOL: ProcessPoolExecutor | None = None
+_POOL_LOCK = threading.Lock()
+_POOL_SIZE = os.cpu_count() or 1
+# Extra wall-clock allowance on top of the CPU budget before the caller gives up
+_WALL_GRACE = 5.0
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # spawn, not fork: the server process has threads (scheduler, HTTP pools)
+            _POOL = ProcessPoolExecutor(
+                max_workers=_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=code_exec_worker.init_worker,
+            )
+        return _POOL
+
+
+def _reset_pool(broken: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died so the next call starts a fresh one."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is broken:
+            _POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_pool)
 
 
 class CodeExecAgent(BaseAgent):
@@ -15,46 +61,33 @@ class CodeExecAgent(BaseAgent):
         code = self.config.get("code", objective)
         timeout = self.config.get("timeout", 30)
 
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        sys.stdout = captured_out = io.StringIO()
-        sys.stderr = captured_err = io.StringIO()
-
-        safe_globals = {
-            "__builtins__": {
-                "print": print, "len": len, "range": range, "str": str,
-                "int": int, "float": float, "list": list, "dict": dict,
-                "tuple": tuple, "set": set, "bool": bool, "type": type,
-                "enumerate": enumerate, "zip": zip, "map": map, "filter": filter,
-                "sorted": sorted, "reversed": reversed, "sum": sum, "min": min,
-                "max": max, "abs": abs, "round": round, "isinstance": isinstance,
-                "True": True, "False": False, "None": None,
-            }
-        }
-
-        if context:
-            safe_globals["context"] = context
-
+        pool = _get_pool()
         try:
-            exec(code, safe_globals)
-            stdout = captured_out.getvalue()
-            stderr = captured_err.getvalue()
+            future = pool.submit(code_exec_worker.execute, code, context, timeout)
+            out = future.result(timeout=timeout + _WALL_GRACE)
+        except FutureTimeout:
+            return self._error_result(f"Execution error: timed out after {timeout}s", start)
+        except BrokenProcessPool:
+            # The worker was killed (e.g. it kept running past its CPU limit)
+            _reset_pool(pool)
+            return self._error_result(f"Execution error: worker terminated (CPU time limit of {timeout}s)", start)
+        except Exception as e:
+            return self._error_result(f"Execution error: {str(e)}", start)
 
-            result = safe_globals.get("result", stdout or "Code executed successfully")
+        if out["success"]:
+            metadata = {"stdout": out["stdout"]}
+        else:
+            metadata = {"traceback": out["traceback"]}
+        return AgentResult(
+            success=out["success"],
+            output=out["output"],
+            duration_ms=int((time.time() - start) * 1000),
+            metadata=metadata,
+        )
 
-            return AgentResult(
-                success=True,
-                output=result,
-                duration_ms=int((time.time() - start) * 1000),
-                metadata={"stdout": stdout, "stderr": stderr},
-            )
-        except Exception as e:
-            return AgentResult(
-                success=False,
-                output=f"Execution error: {str(e)}",
-                duration_ms=int((time.time() - start) * 1000),
-                metadata={"traceback": traceback.format_exc()},
-            )
-        finally:
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+    def _error_result(self, message: str, start: float) -> AgentResult:
+        return AgentResult(
+            success=False,
+            output=message,
+            duration_ms=int((time.time() - start) * 1000),
+        )
@@ -0,0 +1,117 @@
+"""Worker side of CodeExecAgent - runs user code in a pooled subprocess.
+
+Kept free of app imports so spawned workers start fast.
+"""
+import functools
+import io
+import os
+import pickle
+import signal
+import traceback
+import types
+
+try:
+    import resource
+except ImportError:  # no rlimits on Windows; the parent's wall-clock timeout still applies
+    resource = None
+
+
+# Read-only so one task can't poison the next in the same worker.
+# print is bound per call (see execute) so output is captured per task.
+SAFE_BUILTINS = types.MappingProxyType({
+    "len": len, "range": range, "str": str,
+    "int": int, "float": float, "list": list, "dict": dict,
+    "tuple": tuple, "set": set, "bool": bool, "type": type,
+    "enumerate": enumerate, "zip": zip, "map": map, "filter": filter,
+    "sorted": sorted, "reversed": reversed, "sum": sum, "min": min,
+    "max": max, "abs": abs, "round": round, "isinstance": isinstance,
+    "True": True, "False": False, "None": None,
+})
+
+
+class CPUTimeExceeded(BaseException):
+    """Raised in the worker when a task uses up its CPU budget (BaseException so `except Exception` can't swallow it)."""
+
+
+_in_overtime = False
+
+
+def _on_sigxcpu(signum, frame):
+    global _in_overtime
+    if _in_overtime:
+        # The task caught the first signal and kept going; drop the worker, the parent respawns the pool
+        os._exit(1)
+    _in_overtime = True
+    _set_cpu_budget(1)
+    raise CPUTimeExceeded()
+
+
+def init_worker() -> None:
+    """Pool initializer."""
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+
+
+def _set_cpu_budget(seconds: float | None) -> None:
+    """Soft RLIMIT_CPU relative to what this worker has already used (the limit is per process)."""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds is None:
+        soft = hard
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(code: str) -> types.CodeType:
+    """Compile user code once per worker; re-runs of the same node reuse the code object."""
+    return compile(code, "<agent>", "exec")
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def execute(code: str, context: dict | None, timeout: float) -> dict:
+    """Run one task; returns {success, output, stdout, traceback}."""
+    global _in_overtime
+    _in_overtime = False
+    captured_out = io.StringIO()
+    safe_globals = {
+        "__builtins__": SAFE_BUILTINS,
+        "print": functools.partial(print, file=captured_out),
+    }
+    if context:
+        safe_globals["context"] = context
+
+    _set_cpu_budget(timeout)
+    try:
+        exec(_compile(code), safe_globals)
+        stdout = captured_out.getvalue()
+        result = safe_globals.get("result", stdout or "Code executed successfully")
+        return {"success": True, "output": _picklable(result), "stdout": stdout, "traceback": None}
+    except CPUTimeExceeded:
+        return {
+            "success": False,
+            "output": f"Execution error: CPU time limit of {timeout}s exceeded",
+            "stdout": captured_out.getvalue(),
+            "traceback": None,
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "output": f"Execution error: {str(e)}",
+            "stdout": captured_out.getvalue(),
+            "traceback": traceback.format_exc(),
+        }
+    finally:
+        _set_cpu_budget(None)
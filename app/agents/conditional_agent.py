@@ -3,56 +3,67 @@ import time
 import json
 import operator
 from app.agents.base import BaseAgent, AgentResult
+from app.agents.paths import compile_path
 
 
+# op -> (comparison, coerce both sides to float first)
 OPERATORS = {
-    "eq": operator.eq,
-    "ne": operator.ne,
-    "gt": operator.gt,
-    "gte": operator.ge,
-    "lt": operator.lt,
-    "lte": operator.le,
-    "contains": lambda a, b: b in str(a),
-    "not_contains": lambda a, b: b not in str(a),
-    "is_empty": lambda a, _: not a,
-    "is_not_empty": lambda a, _: bool(a),
+    "eq": (operator.eq, False),
+    "ne": (operator.ne, False),
+    "gt": (operator.gt, True),
+    "gte": (operator.ge, True),
+    "lt": (operator.lt, True),
+    "lte": (operator.le, True),
+    "contains": (lambda a, b: b in str(a), False),
+    "not_contains": (lambda a, b: b not in str(a), False),
+    "is_empty": (lambda a, _: not a, False),
+    "is_not_empty": (lambda a, _: bool(a), False),
 }
+_DEFAULT_OPERATOR = OPERATORS["eq"]
 
 
 class ConditionalAgent(BaseAgent):
     name = "conditional"
     description = "Route workflow execution based on conditions - if/else branching"
 
+    def __init__(self, config: dict | None = None, tools: dict | None = None, owner_id: str | None = None):
+        super().__init__(config, tools, owner_id)
+        # Resolve the condition once; run() may be called many times per node
+        self._field = self.config.get("field", "")
+        self._op = self.config.get("operator", "eq")
+        self._path = compile_path(self._field)
+        self._op_fn, self._numeric = OPERATORS.get(self._op, _DEFAULT_OPERATOR)
+        self._raw_value = self._value = self.config.get("value", "")
+        if self._numeric:
+            try:
+                self._value = float(self._raw_value) if self._raw_value else 0
+            except (ValueError, TypeError):
+                pass
+
     def run(self, objective: str, context: dict | None = None) -> AgentResult:
         start = time.time()
-        field = self.config.get("field", "")
-        op = self.config.get("operator", "eq")
-        value = self.config.get("value", "")
-
-        data = context or {}
-        actual = self._extract(data, field)
-        op_fn = OPERATORS.get(op, operator.eq)
+        actual = self._path(context or {})
+        value = self._value
 
         try:
-            # Type coerce for numeric comparisons
-            if op in ("gt", "gte", "lt", "lte"):
+            # Type coerce for numeric comparisons; if actual isn't numeric compare both raw
+            if self._numeric:
                 try:
                     actual = float(actual) if actual else 0
-                    value = float(value) if value else 0
                 except (ValueError, TypeError):
-                    pass
+                    value = self._raw_value
 
-            condition_met = op_fn(actual, value)
+            condition_met = self._op_fn(actual, value)
 
             return AgentResult(
                 success=True,
                 output={
                     "condition_met": condition_met,
                     "branch": "true" if condition_met else "false",
-                    "evaluated": f"{field} {op} {value} => {condition_met}",
+                    "evaluated": f"{self._field} {self._op} {value} => {condition_met}",
                 },
                 duration_ms=int((time.time() - start) * 1000),
-                metadata={"field": field, "operator": op, "value": value, "actual": str(actual)},
+                metadata={"field": self._field, "operator": self._op, "value": value, "actual": str(actual)},
             )
         except Exception as e:
             return AgentResult(
@@ -60,13 +71,3 @@ class ConditionalAgent(BaseAgent):
                 output=f"Condition evaluation failed: {str(e)}",
                 duration_ms=int((time.time() - start) * 1000),
             )
-
-    def _extract(self, data, field: str):
-        parts = field.split(".")
-        current = data
-        for part in parts:
-            if isinstance(current, dict):
-                current = current.get(part)
-            else:
-                return None
-        return current
@@ -1,100 +1,411 @@
 """LLM Agent - uses language models to process text tasks."""
+import asyncio
 import time
 import json
-from typing import Any
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Any, Callable
+import httpx
+from app import jsonutil
 from app.agents.base import BaseAgent, AgentResult
+from app.agents.clients import CLIENT, get_async_client
 from app.config import settings
 
+try:
+    import openai
+except ImportError:  # provider SDKs are optional at import time
+    openai = None
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
+
+ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
+
+# Response cache: sha256(owner + request) -> (stored_at, result). Oldest entries are evicted first.
+_CACHE: dict[str, tuple[float, AgentResult]] = {}
+_CACHE_LOCK = threading.Lock()
+_TTL = 3600
+_CACHE_MAX = 1024
+_BATCH_MAX_WORKERS = 10
+# (event loop id, cache key) -> future of the call already in flight, so identical concurrent
+# requests (e.g. sibling nodes of one workflow wave) are sent once
+_INFLIGHT: dict[tuple[int, str], asyncio.Future] = {}
+
+# The SDKs' own default budget. A client passed as http_client brings its 30s pool timeout
+# instead, too short for long completions, so it is set explicitly on every SDK client.
+_LLM_TIMEOUT = httpx.Timeout(600.0, connect=5.0)
+
+# Built once per process on the shared HTTP/2 pool instead of a fresh pool per call
+_OPENAI_CLIENT = (
+    openai.OpenAI(api_key=settings.OPENAI_API_KEY, http_client=CLIENT, timeout=_LLM_TIMEOUT)
+    if openai and settings.OPENAI_API_KEY else None
+)
+_ANTHROPIC_CLIENT = (
+    anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY, http_client=CLIENT, timeout=_LLM_TIMEOUT)
+    if anthropic and settings.ANTHROPIC_API_KEY else None
+)
+
+
+def _provider() -> str:
+    if settings.OPENAI_API_KEY:
+        return "openai"
+    if settings.ANTHROPIC_API_KEY:
+        return "anthropic"
+    return "ollama"
+
+
+def _ollama_error(resp) -> str:
+    """Message for a failed Ollama response, from its {"error": ...} body when it has one."""
+    try:
+        detail = json.loads(resp.text).get("error") or resp.text
+    except (ValueError, AttributeError):
+        detail = resp.text
+    return f"Ollama returned {resp.status_code}: {detail}"
+
+
+def _cache_key(
+    owner_id: str | None, provider: str, model: str, messages: list[dict], temperature: float, max_tokens: int,
+) -> str:
+    payload = json.dumps(
+        {"owner": owner_id, "provider": provider, "model": model, "messages": messages,
+         "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_get(key: str, start: float) -> AgentResult | None:
+    entry = _CACHE.get(key)
+    if entry is None:
+        return None
+    stored_at, result = entry
+    if time.time() - stored_at >= _TTL:
+        _CACHE.pop(key, None)
+        return None
+    return _as_hit(result, start)
+
+
+def _as_hit(result: AgentResult, start: float) -> AgentResult:
+    # A hit spends no tokens
+    return replace(
+        result,
+        tokens_used=0,
+        cost_usd=0.0,
+        duration_ms=int((time.time() - start) * 1000),
+        metadata={**result.metadata, "cache": "HIT"},
+    )
+
+
+def _cache_put(key: str, result: AgentResult) -> None:
+    with _CACHE_LOCK:
+        _CACHE.pop(key, None)
+        while len(_CACHE) >= _CACHE_MAX:
+            _CACHE.pop(next(iter(_CACHE)))
+        _CACHE[key] = (time.time(), result)
+
 
 class LLMAgent(BaseAgent):
     name = "llm"
     description = "General-purpose language model agent for text generation, analysis, and reasoning"
 
+    def __init__(
+        self, config: dict | None = None, tools: dict | None = None, owner_id: str | None = None,
+        on_chunk: Callable[[str], None] | None = None,
+    ):
+        super().__init__(config, tools, owner_id)
+        # Receives each streamed piece of the reply; a constructor argument, since config is user-saved JSON
+        self.on_chunk = on_chunk
+
     def run(self, objective: str, context: dict | None = None) -> AgentResult:
         start = time.time()
+        model, temperature, max_tokens = self._params()
+        messages = self._build_messages(objective, context)
+        provider = _provider()
+
+        key = self._response_cache_key(provider, model, messages, temperature, max_tokens)
+        if key and (cached := _cache_get(key, start)):
+            self._emit([], cached.output)
+            return cached
+
+        try:
+            if provider == "openai":
+                result = self._call_openai(messages, model, temperature, max_tokens, start)
+            elif provider == "anthropic":
+                result = self._call_anthropic(messages, model, temperature, max_tokens, start)
+            else:
+                result = self._call_ollama(messages, model, temperature, max_tokens, start)
+        except Exception as e:
+            return self._error_result(e, start)
+
+        if key and result.success:
+            _cache_put(key, result)
+        return result
+
+    async def arun(self, objective: str, context: dict | None = None) -> AgentResult:
+        start = time.time()
+        model, temperature, max_tokens = self._params()
+        messages = self._build_messages(objective, context)
+        provider = _provider()
+
+        key = self._response_cache_key(provider, model, messages, temperature, max_tokens)
+        if key and (cached := _cache_get(key, start)):
+            self._emit([], cached.output)
+            return cached
+
+        leader = None
+        while key:
+            flight = (id(asyncio.get_running_loop()), key)
+            pending = _INFLIGHT.get(flight)
+            if pending is None:
+                leader = _INFLIGHT[flight] = asyncio.get_running_loop().create_future()
+                break
+            # Same request already on the wire: share its answer instead of sending a duplicate
+            try:
+                result = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leader's run was cancelled, not ours: retry, sending the call ourselves
+                # unless another follower already took over
+                if pending.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+            if not result.success:
+                return result
+            hit = _as_hit(result, start)
+            self._emit([], hit.output)
+            return hit
+
+        result = None
+        try:
+            if provider == "openai":
+                result = await self._acall_openai(messages, model, temperature, max_tokens, start)
+            elif provider == "anthropic":
+                result = await self._acall_anthropic(messages, model, temperature, max_tokens, start)
+            else:
+                result = await self._acall_ollama(messages, model, temperature, max_tokens, start)
+        except Exception as e:
+            result = self._error_result(e, start)
+        finally:
+            if leader is not None:
+                _INFLIGHT.pop(flight, None)
+                if result is None:  # cancelled
+                    leader.cancel()
+                else:
+                    leader.set_result(result)
+
+        if key and result.success:
+            _cache_put(key, result)
+        return result
+
+    def batch_run(self, objectives: list[str], context: dict | None = None) -> list[AgentResult]:
+        """Issue independent completions concurrently; wall-clock ~ the slowest call."""
+        if len(objectives) <= 1:
+            return super().batch_run(objectives, context)
+        with ThreadPoolExecutor(max_workers=min(_BATCH_MAX_WORKERS, len(objectives))) as pool:
+            return list(pool.map(lambda objective: self.run(objective, context), objectives))
+
+    def _response_cache_key(
+        self, provider: str, model: str, messages: list[dict], temperature: float, max_tokens: int,
+    ) -> str | None:
+        """Key for the response cache and in-flight sharing, or None if the reply mustn't be shared.
+
+        Scoped to the owner, so one tenant never gets another's reply (or learns its prompt).
+        Sampled replies (temperature > 0) are only reused if the agent opts in with
+        config["cache"] = True; otherwise every run would get the first run's sample.
+        """
+        if self.config.get("cache_bypass"):
+            return None
+        if temperature != 0 and self.config.get("cache") is not True:
+            return None
+        return _cache_key(self.owner_id, provider, model, messages, temperature, max_tokens)
+
+    def _params(self) -> tuple[str, float, int]:
         model = self.config.get("model", settings.DEFAULT_MODEL)
-        system_prompt = self.config.get("system_prompt", "You are a helpful AI assistant.")
         temperature = self.config.get("temperature", 0.7)
         max_tokens = self.config.get("max_tokens", 2000)
+        return model, temperature, max_tokens
 
+    def _build_messages(self, objective: str, context: dict | None) -> list[dict]:
+        system_prompt = self.config.get("system_prompt", "You are a helpful AI assistant.")
         messages = [{"role": "system", "content": system_prompt}]
 
         if context:
             messages.append({
                 "role": "user",
-                "content": f"Context from previous steps:\n{json.dumps(context, indent=2, default=str)}"
+                "content": f"Context from previous steps:\n{jsonutil.dumps(context, indent=True)}"
             })
 
         messages.append({"role": "user", "content": objective})
+        return messages
 
-        try:
-            if settings.OPENAI_API_KEY:
-                return self._call_openai(messages, model, temperature, max_tokens, start)
-            elif settings.ANTHROPIC_API_KEY:
-                return self._call_anthropic(messages, model, temperature, max_tokens, start)
-            else:
-                return self._call_ollama(messages, model, temperature, max_tokens, start)
-        except Exception as e:
-            return AgentResult(
-                success=False,
-                output=f"LLM call failed: {str(e)}",
-                duration_ms=int((time.time() - start) * 1000),
-            )
+    def _error_result(self, e: Exception, start: float) -> AgentResult:
+        return AgentResult(
+            success=False,
+            output=f"LLM call failed: {str(e)}",
+            duration_ms=int((time.time() - start) * 1000),
+        )
+
+    def _emit(self, buf: list[str], text: str | None) -> None:
+        """Collect a streamed piece and forward it to on_chunk if set."""
+        if not text:
+            return
+        buf.append(text)
+        if self.on_chunk is not None:
+            self.on_chunk(text)
 
+    # --- OpenAI ---
     def _call_openai(self, messages, model, temperature, max_tokens, start) -> AgentResult:
-        import openai
-        client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-        resp = client.chat.completions.create(
+        if _OPENAI_CLIENT is None:
+            raise RuntimeError("openai package is not installed")
+        stream = _OPENAI_CLIENT.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        buf: list[str] = []
+        finish_reason = usage = None
+        for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices:
+                self._emit(buf, chunk.choices[0].delta.content)
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+        return self._openai_result("".join(buf), finish_reason, usage, model, start)
+
+    async def _acall_openai(self, messages, model, temperature, max_tokens, start) -> AgentResult:
+        if openai is None:
+            raise RuntimeError("openai package is not installed")
+        client = openai.AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY, http_client=get_async_client(), timeout=_LLM_TIMEOUT,
+        )
+        stream = await client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
         )
-        choice = resp.choices[0]
-        tokens = resp.usage.total_tokens if resp.usage else 0
-        cost = self._estimate_cost(model, resp.usage.prompt_tokens or 0, resp.usage.completion_tokens or 0) if resp.usage else 0
+        buf: list[str] = []
+        finish_reason = usage = None
+        async for chunk in stream:
+            usage = chunk.usage or usage
+            if chunk.choices:
+                self._emit(buf, chunk.choices[0].delta.content)
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+        return self._openai_result("".join(buf), finish_reason, usage, model, start)
+
+    def _openai_result(self, text: str, finish_reason: str | None, usage: Any, model: str, start: float) -> AgentResult:
+        tokens = usage.total_tokens if usage else 0
+        cost = self._estimate_cost(model, usage.prompt_tokens or 0, usage.completion_tokens or 0) if usage else 0
         return AgentResult(
             success=True,
-            output=choice.message.content,
+            output=text,
             tokens_used=tokens,
             cost_usd=cost,
             duration_ms=int((time.time() - start) * 1000),
-            metadata={"model": model, "finish_reason": choice.finish_reason},
+            metadata={"model": model, "finish_reason": finish_reason},
         )
 
+    # --- Anthropic ---
     def _call_anthropic(self, messages, model, temperature, max_tokens, start) -> AgentResult:
-        import anthropic
-        client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        if _ANTHROPIC_CLIENT is None:
+            raise RuntimeError("anthropic package is not installed")
+        buf: list[str] = []
+        with _ANTHROPIC_CLIENT.messages.stream(**self._anthropic_request(messages, max_tokens)) as stream:
+            for text in stream.text_stream:
+                self._emit(buf, text)
+            final = stream.get_final_message()
+        return self._anthropic_result("".join(buf), final.usage, start)
+
+    async def _acall_anthropic(self, messages, model, temperature, max_tokens, start) -> AgentResult:
+        if anthropic is None:
+            raise RuntimeError("anthropic package is not installed")
+        client = anthropic.AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY, http_client=get_async_client(), timeout=_LLM_TIMEOUT,
+        )
+        buf: list[str] = []
+        async with client.messages.stream(**self._anthropic_request(messages, max_tokens)) as stream:
+            async for text in stream.text_stream:
+                self._emit(buf, text)
+            final = await stream.get_final_message()
+        return self._anthropic_result("".join(buf), final.usage, start)
+
+    def _anthropic_request(self, messages: list[dict], max_tokens: int) -> dict:
         system_msg = next((m["content"] for m in messages if m["role"] == "system"), "")
         user_msgs = [m for m in messages if m["role"] != "system"]
-        resp = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=max_tokens,
-            system=system_msg,
-            messages=user_msgs,
-        )
-        tokens = resp.usage.input_tokens + resp.usage.output_tokens
+        return {
+            "model": ANTHROPIC_MODEL,
+            "max_tokens": max_tokens,
+            "system": system_msg,
+            "messages": user_msgs,
+        }
+
+    def _anthropic_result(self, text: str, usage: Any, start: float) -> AgentResult:
+        tokens = usage.input_tokens + usage.output_tokens
         return AgentResult(
             success=True,
-            output=resp.content[0].text,
+            output=text,
             tokens_used=tokens,
             cost_usd=tokens * 0.000003,
             duration_ms=int((time.time() - start) * 1000),
-            metadata={"model": "claude-sonnet-4-20250514"},
+            metadata={"model": ANTHROPIC_MODEL},
         )
 
+    # --- Ollama ---
     def _call_ollama(self, messages, model, temperature, max_tokens, start) -> AgentResult:
-        import httpx
-        resp = httpx.post(
+        buf: list[str] = []
+        eval_count = 0
+        with CLIENT.stream(
+            "POST",
             f"{settings.OLLAMA_BASE_URL}/api/chat",
-            json={"model": model, "messages": messages, "stream": False},
+            json={"model": model, "messages": messages, "stream": True},
             timeout=120.0,
-        )
-        data = resp.json()
+        ) as resp:
+            if resp.is_error:
+                resp.read()
+                raise RuntimeError(_ollama_error(resp))
+            for line in resp.iter_lines():
+                eval_count = self._ollama_line(buf, line) or eval_count
+        return self._ollama_result("".join(buf), eval_count, model, start)
+
+    async def _acall_ollama(self, messages, model, temperature, max_tokens, start) -> AgentResult:
+        buf: list[str] = []
+        eval_count = 0
+        async with get_async_client().stream(
+            "POST",
+            f"{settings.OLLAMA_BASE_URL}/api/chat",
+            json={"model": model, "messages": messages, "stream": True},
+            timeout=120.0,
+        ) as resp:
+            if resp.is_error:
+                await resp.aread()
+                raise RuntimeError(_ollama_error(resp))
+            async for line in resp.aiter_lines():
+                eval_count = self._ollama_line(buf, line) or eval_count
+        return self._ollama_result("".join(buf), eval_count, model, start)
+
+    def _ollama_line(self, buf: list[str], line: str) -> int:
+        """Consume one NDJSON line; returns eval_count from the final "done" line."""
+        if not line:
+            return 0
+        data = json.loads(line)
+        if "error" in data:
+            # Ollama reports mid-stream failures as a line of their own, still under a 200
+            raise RuntimeError(f"Ollama error: {data['error']}")
+        self._emit(buf, data.get("message", {}).get("content", ""))
+        return data.get("eval_count", 0) if data.get("done") else 0
+
+    def _ollama_result(self, text: str, eval_count: int, model: str, start: float) -> AgentResult:
         return AgentResult(
             success=True,
-            output=data.get("message", {}).get("content", ""),
-            tokens_used=data.get("eval_count", 0),
+            output=text,
+            tokens_used=eval_count,
             cost_usd=0.0,  # Local = free
             duration_ms=int((time.time() - start) * 1000),
             metadata={"model": model, "provider": "ollama"},
@@ -0,0 +1,38 @@
+"""Dotted-path extractors shared by agents that read fields out of context data."""
+import functools
+from typing import Any, Callable
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_path(field: str) -> Callable[[Any], Any]:
+    """Build an extractor for a dotted path like "results.0.title".
+
+    Dict keys are looked up with .get(); numeric parts index into lists.
+    Anything else yields None. The split happens once per distinct path.
+    """
+    parts = tuple(field.split("."))
+
+    if len(parts) == 1:
+        key = parts[0]
+        index = int(key) if key.isdigit() else None
+
+        def extract_one(data):
+            if isinstance(data, dict):
+                return data.get(key)
+            if index is not None and isinstance(data, list):
+                return data[index]
+            return None
+
+        return extract_one
+
+    def extract(data):
+        for part in parts:
+            if isinstance(data, dict):
+                data = data.get(part)
+            elif isinstance(data, list) and part.isdigit():
+                data = data[int(part)]
+            else:
+                return None
+        return data
+
+    return extract
@@ -18,12 +18,14 @@ AGENT_REGISTRY: dict[str, type[BaseAgent]] = {
 }
 
 
-def get_agent(agent_type: str, config: dict | None = None, tools: dict | None = None) -> BaseAgent:
+def get_agent(
+    agent_type: str, config: dict | None = None, tools: dict | None = None, owner_id: str | None = None,
+) -> BaseAgent:
     """Instantiate an agent by type."""
     cls = AGENT_REGISTRY.get(agent_type)
     if not cls:
         raise ValueError(f"Unknown agent type: {agent_type}. Available: {list(AGENT_REGISTRY.keys())}")
-    return cls(config=config, tools=tools)
+    return cls(config=config, tools=tools, owner_id=owner_id)
 
 
 def list_agent_types() -> list[dict]:
@@ -3,6 +3,11 @@ import time
 import json
 from app.agents.base import BaseAgent, AgentResult
 
+try:
+    from duckduckgo_search import DDGS
+except ImportError:
+    DDGS = None
+
 
 class WebSearchAgent(BaseAgent):
     name = "web_search"
@@ -33,13 +38,11 @@ class WebSearchAgent(BaseAgent):
             )
 
     def _search_ddg(self, query: str, max_results: int) -> list[dict]:
-        try:
-            from duckduckgo_search import DDGS
-            with DDGS() as ddgs:
-                results = list(ddgs.text(query, max_results=max_results))
-                return [
-                    {"title": r.get("title", ""), "url": r.get("href", ""), "snippet": r.get("body", "")}
-                    for r in results
-                ]
-        except ImportError:
+        if DDGS is None:
             return [{"title": "DuckDuckGo search not available", "url": "", "snippet": "Install duckduckgo-search package"}]
+        with DDGS() as ddgs:
+            results = list(ddgs.text(query, max_results=max_results))
+            return [
+                {"title": r.get("title", ""), "url": r.get("href", ""), "snippet": r.get("body", "")}
+                for r in results
+            ]
@@ -1,19 +1,44 @@
 """Authentication - JWT-based auth for the API."""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
+import cachetools
 from passlib.context import CryptContext
-from jose import JWTError, jwt
+import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 from app.config import settings
 from app.db import get_db
 from app.models import User
+from app.services import usage_service
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# argon2id at the OWASP baseline (19 MiB, 2 passes); bcrypt hashes still verify and are
+# upgraded on the next successful login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__memory_cost=19456,
+    argon2__time_cost=2,
+    argon2__parallelism=1,
+)
+# Hashing gets its own bounded pool so sign-in bursts can't starve the threadpool
+# that serves sync endpoints (argon2 releases the GIL while hashing)
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="pwhash")
 security = HTTPBearer()
 
+# token -> (exp, column snapshot). Snapshots, not ORM instances: an instance is bound
+# to the session of the request that loaded it.
+_USER_CACHE: cachetools.TTLCache = cachetools.TTLCache(maxsize=10_000, ttl=60)
+_USER_CACHE_LOCK = threading.Lock()
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -23,6 +48,15 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+async def ahash_password(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_HASH_POOL, hash_password, password)
+
+
+async def averify_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """Verify off the event loop; also returns a new hash when the stored one is outdated (else None)."""
+    return await asyncio.get_running_loop().run_in_executor(_HASH_POOL, pwd_context.verify_and_update, plain, hashed)
+
+
 def create_access_token(user_id: str, email: str) -> str:
     expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {"sub": user_id, "email": email, "exp": expire}
@@ -33,24 +67,47 @@ def get_current_user(
     creds: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db),
 ) -> User:
-    """Decode JWT and return the User from DB."""
+    """Decode JWT and return the User from DB (or the short-lived token cache)."""
     token = creds.credentials
+    with _USER_CACHE_LOCK:
+        cached = _USER_CACHE.get(token)
+    if cached and cached[0] > time.time():
+        return _attach(db, cached[1])
+
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         user_id: str = payload.get("sub")
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid token")
-    except JWTError:
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    snap = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[token] = (payload.get("exp", 0), snap)
     return user
 
 
-def check_usage_limit(user: User) -> None:
-    """Check if user has remaining runs this month."""
+def _attach(db: Session, snap: dict) -> User:
+    """Rebuild a cached user as a persistent instance of this request's session, without a SELECT."""
+    user = User(**snap)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def invalidate_user_cache(user_id: str) -> None:
+    """Drop every cached token for a user; call after mutating the user row."""
+    with _USER_CACHE_LOCK:
+        stale = [token for token, (_, snap) in _USER_CACHE.items() if snap["id"] == user_id]
+        for token in stale:
+            _USER_CACHE.pop(token, None)
+
+
+def check_usage_limit(user: User, db: Session | None = None) -> None:
+    """Check if user has remaining runs this month (Redis counter, DB fallback)."""
     limits = {
         "free": 10,
         "starter": settings.STARTER_RUNS,
@@ -58,7 +115,7 @@ def check_usage_limit(user: User) -> None:
         "enterprise": settings.ENTERPRISE_RUNS,
     }
     limit = limits.get(user.plan, 10)
-    if user.runs_this_month >= limit:
+    if usage_service.get_runs_this_month(user, db) >= limit:
         raise HTTPException(
             status_code=429,
             detail=f"Monthly run limit reached ({limit}). Upgrade your plan for more runs.",
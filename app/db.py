@@ -1,10 +1,24 @@
 """Database setup - SQLAlchemy 2.0 with async support."""
+from datetime import datetime, timezone
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
+from app import jsonutil
 from app.config import settings
 
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+# Sized for request handlers plus background runs; SQLite's pools don't take these
+_pool_args = (
+    {} if settings.DATABASE_URL.startswith("sqlite")
+    else {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}
+)
+# JSON columns go through orjson rather than the stdlib json module
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=True,
+    json_serializer=jsonutil.dumps,
+    json_deserializer=jsonutil.loads,
+    **_pool_args,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -12,6 +26,17 @@ class Base(DeclarativeBase):
     pass
 
 
+def schema_columns(model, schema) -> list:
+    """The model's columns named by a response schema's fields, for Core select()s that skip the ORM."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def now_utc() -> datetime:
+    """Request clock: FastAPI caches dependencies per request, so every Depends(now_utc)
+    in one request sees the same instant."""
+    return datetime.now(timezone.utc)
+
+
 def get_db():
     db = SessionLocal()
     try:
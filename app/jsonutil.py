@@ -0,0 +1,33 @@
+"""JSON helpers - orjson when installed, stdlib json otherwise."""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def dumps(obj, indent: bool = False) -> str:
+    """Serialize to a str, stringifying anything JSON can't represent."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=str, option=option).decode()
+    return json.dumps(obj, default=str, indent=2 if indent else None, separators=None if indent else (",", ":"))
+
+
+def loads(data: str | bytes):
+    """Parse JSON from str or raw bytes (orjson decodes bytes without a str round-trip)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumpb(obj) -> bytes:
+    """Serialize to UTF-8 bytes for HTTP bodies; datetimes as ISO 8601."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_isoformat, separators=(",", ":")).encode()
+
+
+def _isoformat(obj):
+    return obj.isoformat() if hasattr(obj, "isoformat") else str(obj)
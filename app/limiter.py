@@ -0,0 +1,5 @@
+"""Rate limiter shared by the app and routers that set per-route limits."""
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+limiter = Limiter(key_func=get_remote_address, default_limits=["200/minute"])
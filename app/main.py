@@ -10,18 +10,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 from contextlib import asynccontextmanager
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
 from app.config import settings
+from app.limiter import limiter
+from app.responses import ORJSONResponse
 from app.db import init_db
 from app.seed import seed_builtin_agents
 from app.scheduler import start_scheduler, stop_scheduler
 
-limiter = Limiter(key_func=get_remote_address, default_limits=["200/minute"])
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -39,6 +38,7 @@ app = FastAPI(
     version=settings.APP_VERSION,
     description="Visual AI Agent Orchestration Platform - Design, run, and automate AI workflows",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # Rate limiting
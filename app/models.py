@@ -1,7 +1,11 @@
 """Database models for AgentFlow."""
+import os
+import time
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import String, Text, Integer, Float, Boolean, DateTime, ForeignKey, JSON, Index
+from sqlalchemy import String, Text, Integer, Float, Boolean, DateTime, ForeignKey, JSON, Index, Uuid
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.db import Base
 
@@ -11,73 +15,110 @@ def utcnow():
 
 
 def new_id():
-    return str(uuid.uuid4())
+    """UUIDv7 as a string: time-ordered, so inserts append to the primary key index
+    instead of landing on random pages."""
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76  # version 7
+    value = value & ~(0x3 << 62) | 0x2 << 62  # RFC 4122 variant
+    return str(uuid.UUID(int=value))
+
+
+class UUIDStr(TypeDecorator):
+    """UUID key exposed to Python as a str.
+
+    Native 16-byte uuid on Postgres (CHAR(32) elsewhere) instead of VARCHAR(36).
+    A malformed id binds as NULL, so looking one up finds nothing rather than
+    raising a database error.
+    """
+    impl = Uuid(as_uuid=False)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return str(uuid.UUID(str(value)))
+        except ValueError:
+            return None
+
+
+# Binary JSONB on Postgres: no text re-parse in the database, and GIN-indexable if we ever query into it
+JSONDoc = JSON().with_variant(JSONB(), "postgresql")
 
 
 class User(Base):
     __tablename__ = "users"
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_id)
+    id: Mapped[str] = mapped_column(UUIDStr, primary_key=True, default=new_id)
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True)
     name: Mapped[str] = mapped_column(String(255), default="")
     hashed_password: Mapped[str] = mapped_column(String(255))
     plan: Mapped[str] = mapped_column(String(20), default="free")  # free, starter, pro, enterprise
     stripe_customer_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    stripe_subscription_id: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    stripe_subscription_id: Mapped[str | None] = mapped_column(String(255), nullable=True, index=True)
     runs_this_month: Mapped[int] = mapped_column(Integer, default=0)
+    # Running totals for /billing/usage; reset by the first run of a new month (see usage_service.add_usage)
+    tokens_this_month: Mapped[int] = mapped_column(Integer, default=0)
+    cost_usd_this_month: Mapped[float] = mapped_column(Float, default=0.0)
+    usage_period_start: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
-    workflows: Mapped[list["Workflow"]] = relationship(back_populates="user")
+    workflows: Mapped[list["Workflow"]] = relationship(back_populates="user", lazy="raise")
 
 
 class AgentDef(Base):
     """Reusable agent definitions - templates users can drag into workflows."""
     __tablename__ = "agent_defs"
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_id)
+    id: Mapped[str] = mapped_column(UUIDStr, primary_key=True, default=new_id)
     name: Mapped[str] = mapped_column(String(100))
     description: Mapped[str] = mapped_column(Text, default="")
     agent_type: Mapped[str] = mapped_column(String(50))  # llm, web_search, code_exec, data_transform, api_call, conditional
-    config: Mapped[dict] = mapped_column(JSON, default=dict)  # model, prompt template, tools, etc
+    config: Mapped[dict] = mapped_column(JSONDoc, default=dict)  # model, prompt template, tools, etc
     is_builtin: Mapped[bool] = mapped_column(Boolean, default=False)
-    user_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("users.id"), nullable=True)
+    user_id: Mapped[str | None] = mapped_column(UUIDStr, ForeignKey("users.id"), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
 
 class Workflow(Base):
     """A workflow is a directed graph of agent nodes."""
     __tablename__ = "workflows"
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_id)
+    __table_args__ = (
+        # list_workflows: WHERE user_id = ? ORDER BY updated_at DESC
+        Index("ix_workflows_user_updated", "user_id", "updated_at"),
+    )
+    id: Mapped[str] = mapped_column(UUIDStr, primary_key=True, default=new_id)
     name: Mapped[str] = mapped_column(String(200))
     description: Mapped[str] = mapped_column(Text, default="")
-    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id"))
+    user_id: Mapped[str] = mapped_column(UUIDStr, ForeignKey("users.id"))
     # The workflow graph: list of nodes + edges
     # nodes: [{id, agent_def_id, position: {x,y}, config_overrides: {}}]
     # edges: [{source_id, target_id, condition: optional}]
-    graph: Mapped[dict] = mapped_column(JSON, default=lambda: {"nodes": [], "edges": []})
+    graph: Mapped[dict] = mapped_column(JSONDoc, default=lambda: {"nodes": [], "edges": []})
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     schedule_cron: Mapped[str | None] = mapped_column(String(100), nullable=True)  # e.g. "0 8 * * *"
     webhook_secret: Mapped[str | None] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow)
 
-    user: Mapped["User"] = relationship(back_populates="workflows")
-    runs: Mapped[list["WorkflowRun"]] = relationship(back_populates="workflow")
+    user: Mapped["User"] = relationship(back_populates="workflows", lazy="raise")
+    runs: Mapped[list["WorkflowRun"]] = relationship(back_populates="workflow", lazy="raise")
 
 
 class WorkflowRun(Base):
     """A single execution of a workflow."""
     __tablename__ = "workflow_runs"
     __table_args__ = (
-        Index("ix_workflow_runs_workflow_id", "workflow_id"),
+        # list_runs: WHERE workflow_id = ? ORDER BY created_at DESC (also serves plain workflow_id lookups)
+        Index("ix_workflow_runs_workflow_created", "workflow_id", "created_at"),
         Index("ix_workflow_runs_created_at", "created_at"),
     )
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_id)
-    workflow_id: Mapped[str] = mapped_column(String(36), ForeignKey("workflows.id"))
+    id: Mapped[str] = mapped_column(UUIDStr, primary_key=True, default=new_id)
+    workflow_id: Mapped[str] = mapped_column(UUIDStr, ForeignKey("workflows.id"))
     status: Mapped[str] = mapped_column(String(20), default="pending")  # pending, running, completed, failed
     trigger: Mapped[str] = mapped_column(String(20), default="manual")  # manual, scheduled, webhook
-    input_data: Mapped[dict] = mapped_column(JSON, default=dict)
-    output_data: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    input_data: Mapped[dict] = mapped_column(JSONDoc, default=dict)
+    output_data: Mapped[dict | None] = mapped_column(JSONDoc, nullable=True)
     # Per-node results: {node_id: {status, output, duration_ms, tokens_used}}
-    node_results: Mapped[dict] = mapped_column(JSON, default=dict)
+    node_results: Mapped[dict] = mapped_column(JSONDoc, default=dict)
     total_tokens: Mapped[int] = mapped_column(Integer, default=0)
     total_cost_usd: Mapped[float] = mapped_column(Float, default=0.0)
     duration_ms: Mapped[int] = mapped_column(Integer, default=0)
@@ -86,18 +127,22 @@ class WorkflowRun(Base):
     completed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
-    workflow: Mapped["Workflow"] = relationship(back_populates="runs")
+    workflow: Mapped["Workflow"] = relationship(back_populates="runs", lazy="raise")
 
 
 class UsageRecord(Base):
     """Track usage for billing."""
     __tablename__ = "usage_records"
     __table_args__ = (
-        Index("ix_usage_records_user_created", "user_id", "created_at"),
+        # Covering on Postgres: the monthly usage scans read everything they need from the index
+        Index(
+            "ix_usage_user_covering", "user_id", "created_at",
+            postgresql_include=("workflow_run_id", "tokens_used", "cost_usd"),
+        ),
     )
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=new_id)
-    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id"), index=True)
-    workflow_run_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("workflow_runs.id"), nullable=True)
+    id: Mapped[str] = mapped_column(UUIDStr, primary_key=True, default=new_id)
+    user_id: Mapped[str] = mapped_column(UUIDStr, ForeignKey("users.id"))  # leading column of ix_usage_user_covering
+    workflow_run_id: Mapped[str | None] = mapped_column(UUIDStr, ForeignKey("workflow_runs.id"), nullable=True)
     tokens_used: Mapped[int] = mapped_column(Integer, default=0)
     cost_usd: Mapped[float] = mapped_column(Float, default=0.0)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
@@ -0,0 +1,39 @@
+"""Shared Redis connection - optional; callers fall back to Postgres when it is down."""
+from __future__ import annotations
+import logging
+import time
+
+import redis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Don't retry a dead Redis on every request; wait this long after a failure
+_RETRY_AFTER = 30.0
+
+_client: redis.Redis | None = None
+_down_until = 0.0
+
+
+def get_redis() -> redis.Redis | None:
+    """Return the pooled client, or None while Redis is marked unavailable."""
+    global _client
+    if time.monotonic() < _down_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=0.25,
+            socket_connect_timeout=0.25,
+        )
+    return _client
+
+
+def mark_unavailable(exc: Exception) -> None:
+    """Record a Redis failure so get_redis() returns None for a while."""
+    global _down_until
+    if time.monotonic() >= _down_until:
+        logger.warning(f"Redis unavailable, falling back to Postgres: {exc}")
+    _down_until = time.monotonic() + _RETRY_AFTER
@@ -0,0 +1,16 @@
+"""Response classes - API payloads rendered straight to bytes with orjson."""
+from typing import Any
+from fastapi.responses import JSONResponse
+
+from app import jsonutil
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson.
+
+    Returning one from a handler skips FastAPI's response_model re-validation and
+    jsonable_encoder pass; response_model stays on the route for the OpenAPI docs.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return jsonutil.dumpb(content)
@@ -1,15 +1,25 @@
 """Agent definition router - manage reusable agent templates."""
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import bindparam, lambda_stmt, select, update, delete
 from sqlalchemy.orm import Session
 
-from app.db import get_db
+from app.db import get_db, schema_columns
 from app.models import User, AgentDef
-from app.schemas import AgentDefCreate, AgentDefOut
+from app.schemas import AgentDefCreate, AgentDefOut, out_dict
 from app.auth import get_current_user
 from app.agents.registry import list_agent_types
+from app.responses import ORJSONResponse
+from app.services.agent_def_service import invalidate_agent_defs
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
+# Built once so the compiled SQL is reused; only user_id is bound per call
+LIST_AGENT_DEFS = lambda_stmt(lambda: (
+    select(*schema_columns(AgentDef, AgentDefOut))
+    .where((AgentDef.is_builtin == True) | (AgentDef.user_id == bindparam("user_id")))
+    .order_by(AgentDef.name)
+))
+
 
 @router.get("/types")
 def get_agent_types():
@@ -20,13 +30,8 @@ def get_agent_types():
 @router.get("/", response_model=list[AgentDefOut])
 def list_agent_defs(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """List builtin + user's custom agent definitions."""
-    agents = (
-        db.query(AgentDef)
-        .filter((AgentDef.is_builtin == True) | (AgentDef.user_id == user.id))
-        .order_by(AgentDef.name)
-        .all()
-    )
-    return [AgentDefOut.model_validate(a) for a in agents]
+    rows = db.execute(LIST_AGENT_DEFS, {"user_id": user.id}).mappings()
+    return ORJSONResponse([dict(r) for r in rows])
 
 
 @router.post("/", response_model=AgentDefOut, status_code=201)
@@ -42,27 +47,28 @@ def create_agent_def(data: AgentDefCreate, user: User = Depends(get_current_user
     db.add(agent)
     db.commit()
     db.refresh(agent)
-    return AgentDefOut.model_validate(agent)
+    return ORJSONResponse(out_dict(AgentDefOut, agent), status_code=201)
 
 
 @router.put("/{agent_id}", response_model=AgentDefOut)
 def update_agent_def(agent_id: str, data: AgentDefCreate, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    agent = db.query(AgentDef).filter(AgentDef.id == agent_id, AgentDef.user_id == user.id).first()
-    if not agent:
+    row = db.execute(
+        update(AgentDef)
+        .where(AgentDef.id == agent_id, AgentDef.user_id == user.id)
+        .values(**data.model_dump())
+        .returning(*schema_columns(AgentDef, AgentDefOut))
+    ).mappings().first()
+    if not row:
         raise HTTPException(status_code=404, detail="Agent not found")
-    agent.name = data.name
-    agent.description = data.description
-    agent.agent_type = data.agent_type
-    agent.config = data.config
     db.commit()
-    db.refresh(agent)
-    return AgentDefOut.model_validate(agent)
+    invalidate_agent_defs()
+    return ORJSONResponse(dict(row))
 
 
 @router.delete("/{agent_id}", status_code=204)
 def delete_agent_def(agent_id: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    agent = db.query(AgentDef).filter(AgentDef.id == agent_id, AgentDef.user_id == user.id).first()
-    if not agent:
+    res = db.execute(delete(AgentDef).where(AgentDef.id == agent_id, AgentDef.user_id == user.id))
+    if res.rowcount == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
-    db.delete(agent)
     db.commit()
+    invalidate_agent_defs()
@@ -1,13 +1,21 @@
 """Auth router - registration, login, profile."""
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
 
 from app.db import get_db
 from app.models import User
-from app.schemas import UserRegister, UserLogin, TokenResponse, UserOut
-from app.auth import hash_password, verify_password, create_access_token, get_current_user
+from app.schemas import UserRegister, UserLogin, TokenResponse, UserOut, out_dict
+from app.auth import (
+    hash_password, verify_password, ahash_password, averify_password,
+    create_access_token, get_current_user, invalidate_user_cache,
+)
+from app.limiter import limiter
+from app.services import usage_service
+from app.responses import ORJSONResponse
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -19,37 +27,68 @@ class UserUpdate(BaseModel):
 
 
 @router.post("/register", response_model=TokenResponse)
-def register(data: UserRegister, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.email == data.email).first()
-    if existing:
+@limiter.limit("10/minute")
+async def register(request: Request, data: UserRegister, db: Session = Depends(get_db)):
+    # async so the hash runs on the auth hashing pool, not a request thread; DB work stays in the threadpool
+    if await run_in_threadpool(_find_user, db, data.email):
         raise HTTPException(status_code=400, detail="Email already registered")
 
     user = User(
         email=data.email,
         name=data.name,
-        hashed_password=hash_password(data.password),
+        hashed_password=await ahash_password(data.password),
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    await run_in_threadpool(_insert_user, db, user)
 
-    token = create_access_token(user.id, user.email)
-    return TokenResponse(access_token=token, user=UserOut.model_validate(user))
+    return _token_response(await run_in_threadpool(_user_out, db, user))
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(data: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == data.email).first()
-    if not user or not verify_password(data.password, user.hashed_password):
+@limiter.limit("10/minute")
+async def login(request: Request, data: UserLogin, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_find_user, db, data.email)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    valid, new_hash = await averify_password(data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # Stored hash predates the current scheme/parameters
+        await run_in_threadpool(_rehash_user, db, user, new_hash)
+
+    return _token_response(await run_in_threadpool(_user_out, db, user))
+
+
+def _token_response(user_out: dict) -> ORJSONResponse:
+    token = create_access_token(user_out["id"], user_out["email"])
+    return ORJSONResponse({"access_token": token, "token_type": "bearer", "user": user_out})
+
+
+def _user_out(db: Session, user: User) -> dict:
+    """UserOut payload with the live run count (the users column is only settled nightly)."""
+    return {**out_dict(UserOut, user), "runs_this_month": usage_service.get_runs_this_month(user, db)}
 
-    token = create_access_token(user.id, user.email)
-    return TokenResponse(access_token=token, user=UserOut.model_validate(user))
+
+def _find_user(db: Session, email: str) -> User | None:
+    return db.query(User).filter(User.email == email).first()
+
+
+def _insert_user(db: Session, user: User) -> None:
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+
+def _rehash_user(db: Session, user: User, new_hash: str) -> None:
+    db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+    db.commit()
+    db.refresh(user)  # reload here, not lazily on the event loop
+    invalidate_user_cache(user.id)
 
 
 @router.get("/me", response_model=UserOut)
-def get_profile(user: User = Depends(get_current_user)):
-    return UserOut.model_validate(user)
+def get_profile(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    return ORJSONResponse(_user_out(db, user))
 
 
 @router.put("/me", response_model=UserOut)
@@ -63,5 +102,6 @@ def update_profile(data: UserUpdate, user: User = Depends(get_current_user), db:
             raise HTTPException(status_code=400, detail="New password must be at least 8 characters")
         user.hashed_password = hash_password(data.new_password)
     db.commit()
+    invalidate_user_cache(user.id)
     db.refresh(user)
-    return UserOut.model_validate(user)
+    return ORJSONResponse(_user_out(db, user))
@@ -1,28 +1,31 @@
 """Billing router - Stripe subscriptions and usage tracking."""
+import stripe
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from app.db import get_db
-from app.models import User, UsageRecord
+from app.models import User
 from app.schemas import UsageStats
-from app.auth import get_current_user
+from app.auth import get_current_user, invalidate_user_cache
 from app.config import settings
+from app.services import usage_service
+from app.responses import ORJSONResponse
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
+if settings.STRIPE_SECRET_KEY:
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+
+# Stripe event payloads are a few KB; anything near this is not from Stripe
+MAX_WEBHOOK_BYTES = 65536
+
 
 @router.get("/usage", response_model=UsageStats)
 def get_usage(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
     """Get current month's usage stats."""
-    totals = (
-        db.query(
-            func.coalesce(func.sum(UsageRecord.tokens_used), 0).label("tokens"),
-            func.coalesce(func.sum(UsageRecord.cost_usd), 0).label("cost"),
-        )
-        .filter(UsageRecord.user_id == user.id)
-        .first()
-    )
+    tokens, cost = usage_service.get_month_totals(user)
 
     limits = {
         "free": 10,
@@ -31,13 +34,13 @@ def get_usage(user: User = Depends(get_current_user), db: Session = Depends(get_
         "enterprise": settings.ENTERPRISE_RUNS,
     }
 
-    return UsageStats(
-        runs_this_month=user.runs_this_month,
-        total_tokens=totals.tokens,
-        total_cost_usd=round(float(totals.cost), 4),
+    return ORJSONResponse(UsageStats(
+        runs_this_month=usage_service.get_runs_this_month(user, db),
+        total_tokens=tokens,
+        total_cost_usd=round(cost, 4),
         plan=user.plan,
         runs_limit=limits.get(user.plan, 10),
-    )
+    ).model_dump())
 
 
 @router.post("/checkout")
@@ -46,9 +49,6 @@ def create_checkout(plan: str, user: User = Depends(get_current_user)):
     if not settings.STRIPE_SECRET_KEY:
         raise HTTPException(status_code=503, detail="Stripe not configured")
 
-    import stripe
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
     price_map = {
         "starter": settings.STRIPE_PRICE_STARTER,
         "pro": settings.STRIPE_PRICE_PRO,
@@ -79,10 +79,7 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     if not settings.STRIPE_SECRET_KEY or not settings.STRIPE_WEBHOOK_SECRET:
         raise HTTPException(status_code=503, detail="Stripe not configured")
 
-    import stripe
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
-    payload = await request.body()
+    payload = await _read_body(request, MAX_WEBHOOK_BYTES)
     sig_header = request.headers.get("stripe-signature")
 
     try:
@@ -90,27 +87,44 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid webhook signature")
 
+    obj = event["data"]["object"]
     if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        user_id = session.get("metadata", {}).get("user_id")
-        plan = session.get("metadata", {}).get("plan")
-        customer_id = session.get("customer")
-        subscription_id = session.get("subscription")
-
+        # Attribute access on the StripeObject; newer stripe-python objects have no dict .get()
+        metadata = getattr(obj, "metadata", None)
+        user_id, plan = getattr(metadata, "user_id", None), getattr(metadata, "plan", None)
         if user_id and plan:
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.plan = plan
-                user.stripe_customer_id = customer_id
-                user.stripe_subscription_id = subscription_id
-                db.commit()
+            await run_in_threadpool(
+                _set_subscription, db, User.id == user_id,
+                plan=plan,
+                stripe_customer_id=getattr(obj, "customer", None),
+                stripe_subscription_id=getattr(obj, "subscription", None),
+            )
 
     elif event["type"] == "customer.subscription.deleted":
-        subscription = event["data"]["object"]
-        user = db.query(User).filter(User.stripe_subscription_id == subscription["id"]).first()
-        if user:
-            user.plan = "free"
-            user.stripe_subscription_id = None
-            db.commit()
+        await run_in_threadpool(
+            _set_subscription, db, User.stripe_subscription_id == obj.id,
+            plan="free", stripe_subscription_id=None,
+        )
 
     return {"status": "ok"}
+
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """Read the request body, answering 413 as soon as it passes `limit` bytes."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > limit:
+        raise HTTPException(status_code=413, detail="Payload too large")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail="Payload too large")
+    return bytes(body)
+
+
+def _set_subscription(db: Session, where, **values) -> None:
+    """Update the matching user's plan fields in one UPDATE ... RETURNING (no SELECT first)."""
+    user_id = db.execute(update(User).where(where).values(**values).returning(User.id)).scalar()
+    if user_id:
+        db.commit()
+        invalidate_user_cache(user_id)
@@ -1,5 +1,6 @@
 """Template router - pre-built workflow templates users can clone."""
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Response
+from app import jsonutil
 from app.schemas import TemplateInfo, WorkflowGraph, WorkflowNode, WorkflowEdge
 
 router = APIRouter(prefix="/templates", tags=["templates"])
@@ -126,17 +127,21 @@ TEMPLATES = [
 ]
 
 
+# Templates are static: serialize once at import, serve the bytes as-is
+_TEMPLATES_JSON = jsonutil.dumpb([t.model_dump() for t in TEMPLATES])
+_TEMPLATE_JSON_BY_ID = {t.id: jsonutil.dumpb(t.model_dump()) for t in TEMPLATES}
+
+
 @router.get("/", response_model=list[TemplateInfo])
 def list_templates():
     """List all available workflow templates."""
-    return TEMPLATES
+    return Response(_TEMPLATES_JSON, media_type="application/json")
 
 
 @router.get("/{template_id}", response_model=TemplateInfo)
 def get_template(template_id: str):
     """Get a specific template."""
-    for t in TEMPLATES:
-        if t.id == template_id:
-            return t
-    from fastapi import HTTPException
-    raise HTTPException(status_code=404, detail="Template not found")
+    body = _TEMPLATE_JSON_BY_ID.get(template_id)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Template not found")
+    return Response(body, media_type="application/json")
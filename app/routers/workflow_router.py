@@ -1,145 +1,342 @@
 """Workflow router - CRUD + execution."""
+import asyncio
 import secrets
+import threading
 from datetime import datetime, timezone
-from fastapi import APIRouter, Depends, HTTPException, Request, Header
+import cachetools
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import bindparam, lambda_stmt, select, update, delete
 from sqlalchemy.orm import Session
 from typing import Optional
 
-from app.db import get_db
-from app.models import User, Workflow, WorkflowRun, AgentDef, UsageRecord
+from app import jsonutil
+from app.db import SessionLocal, get_db, now_utc, schema_columns
+from app.models import User, Workflow, WorkflowRun, UsageRecord, new_id
 from app.schemas import (
     WorkflowCreate, WorkflowUpdate, WorkflowOut,
-    RunWorkflow, WorkflowRunOut,
+    RunWorkflow, WorkflowRunOut, out_dict,
 )
-from app.auth import get_current_user, check_usage_limit
+from app.auth import get_current_user, check_usage_limit, invalidate_user_cache
 from app.workflows.engine import WorkflowEngine
 from app.scheduler import schedule_workflow, unschedule_workflow
+from app.services import usage_service
+from app.services.agent_def_service import resolve_agent_defs
+from app.responses import ORJSONResponse
 
 router = APIRouter(prefix="/workflows", tags=["workflows"])
 
+# Hot read queries, built once: SQLAlchemy caches their compiled SQL and only binds parameters per call
+LIST_WORKFLOWS = lambda_stmt(lambda: (
+    select(*schema_columns(Workflow, WorkflowOut))
+    .where(Workflow.user_id == bindparam("user_id"))
+    .order_by(Workflow.updated_at.desc())
+))
+GET_WORKFLOW = lambda_stmt(lambda: (
+    select(Workflow)
+    .where(Workflow.id == bindparam("workflow_id"), Workflow.user_id == bindparam("user_id"))
+))
+WORKFLOW_VERSION = lambda_stmt(lambda: (
+    select(Workflow.updated_at)
+    .where(Workflow.id == bindparam("workflow_id"), Workflow.user_id == bindparam("user_id"))
+))
+WORKFLOW_EXISTS = lambda_stmt(lambda: (
+    select(Workflow.id)
+    .where(Workflow.id == bindparam("workflow_id"), Workflow.user_id == bindparam("user_id"))
+))
+LIST_RUNS = lambda_stmt(lambda: (
+    select(*schema_columns(WorkflowRun, WorkflowRunOut))
+    .where(WorkflowRun.workflow_id == bindparam("workflow_id"))
+    .order_by(WorkflowRun.created_at.desc())
+    .limit(bindparam("limit"))
+))
+
 
 @router.get("/", response_model=list[WorkflowOut])
 def list_workflows(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    workflows = db.query(Workflow).filter(Workflow.user_id == user.id).order_by(Workflow.updated_at.desc()).all()
-    return [WorkflowOut.model_validate(w) for w in workflows]
+    # Read-only: plain rows, no ORM objects or schema validation per workflow
+    rows = db.execute(LIST_WORKFLOWS, {"user_id": user.id}).mappings()
+    return ORJSONResponse([dict(r) for r in rows])
 
 
 @router.post("/", response_model=WorkflowOut, status_code=201)
-def create_workflow(data: WorkflowCreate, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_workflow(
+    data: WorkflowCreate,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    now: datetime = Depends(now_utc),
+):
     wf = Workflow(
         name=data.name,
         description=data.description,
         user_id=user.id,
-        graph=data.graph.model_dump(),
+        graph=data.graph.stored(),
         schedule_cron=data.schedule_cron,
+        created_at=now,
+        updated_at=now,
     )
     db.add(wf)
     db.commit()
     db.refresh(wf)
-    return WorkflowOut.model_validate(wf)
+    return ORJSONResponse(out_dict(WorkflowOut, wf), status_code=201)
+
+
+# (user id, workflow id) -> (updated_at, encoded WorkflowOut). Every write bumps updated_at,
+# so an entry is only served while it matches the row's current version.
+_WF_CACHE: cachetools.LRUCache = cachetools.LRUCache(maxsize=4096)
+_WF_CACHE_LOCK = threading.Lock()
 
 
 @router.get("/{workflow_id}", response_model=WorkflowOut)
-def get_workflow(workflow_id: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.id == workflow_id, Workflow.user_id == user.id).first()
-    if not wf:
+def get_workflow(workflow_id: str, request: Request, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # The editor re-reads this constantly; check the version first and only load the row when it moved
+    params = {"workflow_id": workflow_id, "user_id": user.id}
+    version = db.execute(WORKFLOW_VERSION, params).scalar()
+    if version is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    return WorkflowOut.model_validate(wf)
+    etag = f'"{version.isoformat()}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    key = (user.id, workflow_id)
+    with _WF_CACHE_LOCK:
+        cached = _WF_CACHE.get(key)
+    if cached and cached[0] == version:
+        body = cached[1]
+    else:
+        wf = db.execute(GET_WORKFLOW, params).scalar()
+        if not wf:
+            raise HTTPException(status_code=404, detail="Workflow not found")
+        body = jsonutil.dumpb(out_dict(WorkflowOut, wf))
+        with _WF_CACHE_LOCK:
+            _WF_CACHE[key] = (wf.updated_at, body)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
 
 @router.put("/{workflow_id}", response_model=WorkflowOut)
-def update_workflow(workflow_id: str, data: WorkflowUpdate, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.id == workflow_id, Workflow.user_id == user.id).first()
-    if not wf:
+def update_workflow(
+    workflow_id: str,
+    data: WorkflowUpdate,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    now: datetime = Depends(now_utc),
+):
+    values = data.model_dump(exclude_none=True)
+    if data.graph is not None:
+        values["graph"] = data.graph.stored()
+    # Ownership check, update and re-read in one statement
+    row = db.execute(
+        update(Workflow)
+        .where(Workflow.id == workflow_id, Workflow.user_id == user.id)
+        .values(**values, updated_at=now)
+        .returning(*schema_columns(Workflow, WorkflowOut))
+    ).mappings().first()
+    if not row:
         raise HTTPException(status_code=404, detail="Workflow not found")
+    db.commit()
 
-    if data.name is not None:
-        wf.name = data.name
-    if data.description is not None:
-        wf.description = data.description
-    if data.graph is not None:
-        wf.graph = data.graph.model_dump()
-    if data.schedule_cron is not None:
-        wf.schedule_cron = data.schedule_cron
-        # Update scheduler
-        if data.schedule_cron and wf.is_active:
-            schedule_workflow(wf.id, data.schedule_cron)
+    # Update scheduler
+    if data.schedule_cron is not None or data.is_active is not None:
+        if row["is_active"] and row["schedule_cron"]:
+            schedule_workflow(row["id"], row["schedule_cron"])
         else:
-            unschedule_workflow(wf.id)
-    if data.is_active is not None:
-        wf.is_active = data.is_active
-        if not data.is_active:
-            unschedule_workflow(wf.id)
-        elif wf.schedule_cron:
-            schedule_workflow(wf.id, wf.schedule_cron)
-
-    wf.updated_at = datetime.now(timezone.utc)
-    db.commit()
-    db.refresh(wf)
-    return WorkflowOut.model_validate(wf)
+            unschedule_workflow(row["id"])
+    return ORJSONResponse(dict(row))
 
 
 @router.delete("/{workflow_id}", status_code=204)
 def delete_workflow(workflow_id: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.id == workflow_id, Workflow.user_id == user.id).first()
-    if not wf:
+    res = db.execute(delete(Workflow).where(Workflow.id == workflow_id, Workflow.user_id == user.id))
+    if res.rowcount == 0:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    db.delete(wf)
     db.commit()
+    unschedule_workflow(workflow_id)
 
 
 @router.post("/{workflow_id}/run", response_model=WorkflowRunOut)
-def run_workflow(workflow_id: str, data: RunWorkflow, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Execute a workflow and return results."""
-    check_usage_limit(user)
+async def run_workflow(
+    workflow_id: str,
+    data: RunWorkflow,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    now: datetime = Depends(now_utc),
+):
+    """Execute a workflow and return results.
+
+    With ?background=true the run is queued and 202 returns the pending run
+    immediately; its result shows up in GET /workflows/{id}/runs.
+    """
+    graph, agent_defs = await run_in_threadpool(_start_run, db, user, workflow_id)
+    # The id is generated client-side, so nothing has to be written before the run
+    fields = {
+        "id": new_id(),
+        "workflow_id": workflow_id,
+        "status": "running",
+        "trigger": "manual",
+        "input_data": data.input_data,
+        "started_at": now,
+    }
+    if background:
+        # Background runs need a visible row to poll, so they pay for a second commit
+        run_out = await run_in_threadpool(_insert_run, db, fields)
+        background_tasks.add_task(_finish_run, fields, True, user.id, graph, agent_defs)
+        return ORJSONResponse(run_out, status_code=202)
+    # Off the event loop and off the request's DB connection while agents run
+    return ORJSONResponse(await asyncio.to_thread(_finish_run, fields, False, user.id, graph, agent_defs))
+
+
+@router.post("/{workflow_id}/run/stream")
+async def stream_workflow_run(
+    workflow_id: str,
+    data: RunWorkflow,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    now: datetime = Depends(now_utc),
+):
+    """Execute a workflow, streaming progress as server-sent events.
+
+    Each node's result is sent as soon as its wave finishes; the last event carries the
+    saved run. Disconnecting stops the run before its next wave and records it as failed,
+    billed for the nodes that finished.
+    """
+    graph, agent_defs = await run_in_threadpool(_start_run, db, user, workflow_id)
+    fields = {
+        "id": new_id(),
+        "workflow_id": workflow_id,
+        "status": "running",
+        "trigger": "manual",
+        "input_data": data.input_data,
+        "started_at": now,
+    }
+    engine = WorkflowEngine(graph=graph, agent_defs=agent_defs, owner_id=user.id)
+    return StreamingResponse(_run_events(engine, fields, user.id), media_type="text/event-stream")
+
+
+async def _run_events(engine: WorkflowEngine, fields: dict, user_id: str):
+    saved = threading.Event()  # set by the saving thread, so it holds even if our await was cancelled
+    saving = None
+
+    def save(result: dict, error: str | None = None) -> dict:
+        run_out = _save_run(fields, False, user_id, result, error)
+        saved.set()
+        return run_out
+
+    try:
+        async for event in engine.stream_run(fields["input_data"]):
+            if event["type"] == "run_complete":
+                # Shielded: a disconnect mid-save leaves the save running; it is waited for below
+                saving = asyncio.ensure_future(asyncio.to_thread(save, event["result"]))
+                event = {"type": "run_complete", "run": await asyncio.shield(saving)}
+            yield b"data: " + jsonutil.dumpb(event) + b"\n\n"
+    except BaseException as e:  # including the cancellation of a dropped connection
+        if saving is not None:
+            await asyncio.wait([saving])  # never two writers for one run
+        if saved.is_set():
+            raise
+        if isinstance(e, Exception):
+            # Engine crash (or a failed save): same as a synchronous run's
+            await asyncio.to_thread(_fail_run, fields, user_id, str(e))
+        else:
+            # Client went away: the nodes that finished were streamed to it, so bill them
+            await asyncio.to_thread(save, engine.partial_result(), "Run aborted: client disconnected")
+        raise
+
+
+def _start_run(db: Session, user: User, workflow_id: str) -> tuple[dict, dict]:
+    """Check the run limit, load the workflow and count the run against the limit.
+
+    The run counts from here, not from when it finishes, so runs still in flight (e.g.
+    queued with ?background=true) can't slip past the next limit check; _fail_run gives
+    the run back if the engine crashes.
+    """
+    check_usage_limit(user, db)
 
     wf = db.query(Workflow).filter(Workflow.id == workflow_id, Workflow.user_id == user.id).first()
     if not wf:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
     # Load agent definitions for this workflow
-    agent_def_ids = [n.get("agent_def_id", "") for n in wf.graph.get("nodes", []) if n.get("agent_def_id")]
-    agent_defs_db = db.query(AgentDef).filter(AgentDef.id.in_(agent_def_ids)).all() if agent_def_ids else []
-    agent_defs = {ad.id: {"agent_type": ad.agent_type, "config": ad.config} for ad in agent_defs_db}
+    agent_defs = resolve_agent_defs(db, wf)
 
-    # Create run record
-    run = WorkflowRun(
-        workflow_id=wf.id,
-        trigger="manual",
-        input_data=data.input_data,
-        started_at=datetime.now(timezone.utc),
-    )
+    usage_service.record_run(db, user)
+    db.commit()
+    invalidate_user_cache(user.id)
+    return wf.graph, agent_defs
+
+
+def _insert_run(db: Session, fields: dict) -> dict:
+    run = WorkflowRun(**fields)
     db.add(run)
     db.commit()
+    return out_dict(WorkflowRunOut, run)
 
-    # Execute
-    engine = WorkflowEngine(graph=wf.graph, agent_defs=agent_defs)
-    result = engine.run(input_data=data.input_data)
 
-    # Update run record
-    run.status = result["status"]
-    run.output_data = result["output_data"]
-    run.node_results = result["node_results"]
-    run.total_tokens = result["total_tokens"]
-    run.total_cost_usd = result["total_cost_usd"]
-    run.duration_ms = result["duration_ms"]
-    run.completed_at = datetime.now(timezone.utc)
-    if result.get("failed_node"):
-        run.error = f"Failed at node: {result['failed_node']}"
+def _finish_run(fields: dict, inserted: bool, user_id: str, graph: dict, agent_defs: dict) -> dict:
+    """Execute the engine, then save its result."""
+    engine = WorkflowEngine(graph=graph, agent_defs=agent_defs, owner_id=user_id)
+    try:
+        result = engine.run(input_data=fields["input_data"])
+    except Exception as e:
+        _fail_run(fields, user_id, str(e))
+        raise
+    return _save_run(fields, inserted, user_id, result)
 
-    # Track usage
-    user.runs_this_month += 1
-    usage = UsageRecord(
-        user_id=user.id,
-        workflow_run_id=run.id,
-        tokens_used=result["total_tokens"],
-        cost_usd=result["total_cost_usd"],
-    )
-    db.add(usage)
-    db.commit()
-    db.refresh(run)
 
-    return WorkflowRunOut.model_validate(run)
+def _save_run(fields: dict, inserted: bool, user_id: str, result: dict, error: str | None = None) -> dict:
+    """Write a finished run + usage in one commit, in a session of its own
+    (the request's may already be closed)."""
+    db = SessionLocal()
+    try:
+        if inserted:
+            run = db.get(WorkflowRun, fields["id"])
+        else:
+            run = WorkflowRun(**fields)
+            db.add(run)
+        run.status = result["status"]
+        run.output_data = result["output_data"]
+        run.node_results = result["node_results"]
+        run.total_tokens = result["total_tokens"]
+        run.total_cost_usd = result["total_cost_usd"]
+        run.duration_ms = result["duration_ms"]
+        run.completed_at = datetime.now(timezone.utc)
+        if error:
+            run.error = error
+        elif result.get("failed_node"):
+            run.error = f"Failed at node: {result['failed_node']}"
+
+        # Track usage, stamped with the same clock read as the run's completion
+        usage = UsageRecord(
+            user_id=user_id,
+            workflow_run_id=run.id,
+            tokens_used=result["total_tokens"],
+            cost_usd=result["total_cost_usd"],
+            created_at=run.completed_at,
+        )
+        db.add(usage)
+        # Counted against the run limit when it started (_start_run)
+        usage_service.add_usage(db, user_id, result["total_tokens"], result["total_cost_usd"])
+        db.commit()
+        run_out = out_dict(WorkflowRunOut, run)
+    finally:
+        db.close()
+    invalidate_user_cache(user_id)
+    return run_out
+
+
+def _fail_run(fields: dict, user_id: str, error: str) -> None:
+    """Record an engine crash; inserts the row if this run was never written, and gives
+    back the run _start_run counted."""
+    db = SessionLocal()
+    try:
+        db.merge(WorkflowRun(**{**fields, "status": "failed"}, error=error, completed_at=datetime.now(timezone.utc)))
+        usage_service.release_run(db, user_id)
+        db.commit()
+    finally:
+        db.close()
+    invalidate_user_cache(user_id)
 
 
 @router.post("/{workflow_id}/webhook/enable")
@@ -159,6 +356,7 @@ async def webhook_trigger(
     request: Request,
     x_webhook_secret: Optional[str] = Header(None),
     db: Session = Depends(get_db),
+    now: datetime = Depends(now_utc),
 ):
     """Trigger a workflow via webhook. Requires X-Webhook-Secret header."""
     wf = db.query(Workflow).filter(Workflow.id == workflow_id).first()
@@ -176,21 +374,19 @@ async def webhook_trigger(
     except Exception:
         body = {}
 
-    agent_def_ids = [n.get("agent_def_id", "") for n in wf.graph.get("nodes", []) if n.get("agent_def_id")]
-    agent_defs_db = db.query(AgentDef).filter(AgentDef.id.in_(agent_def_ids)).all() if agent_def_ids else []
-    agent_defs = {ad.id: {"agent_type": ad.agent_type, "config": ad.config} for ad in agent_defs_db}
+    agent_defs = resolve_agent_defs(db, wf)
 
     run = WorkflowRun(
         workflow_id=wf.id,
         trigger="webhook",
         input_data=body,
-        started_at=datetime.now(timezone.utc),
+        started_at=now,
     )
     db.add(run)
     db.commit()
 
-    engine = WorkflowEngine(graph=wf.graph, agent_defs=agent_defs)
-    result = engine.run(input_data=body)
+    engine = WorkflowEngine(graph=wf.graph, agent_defs=agent_defs, owner_id=wf.user_id)
+    result = await engine.run_async(input_data=body)
 
     run.status = result["status"]
     run.output_data = result["output_data"]
@@ -209,22 +405,17 @@ async def webhook_trigger(
         cost_usd=result["total_cost_usd"],
     )
     db.add(usage)
+    usage_service.add_usage(db, wf.user_id, result["total_tokens"], result["total_cost_usd"])
     db.commit()
+    invalidate_user_cache(wf.user_id)
     db.refresh(run)
-    return WorkflowRunOut.model_validate(run)
+    return ORJSONResponse(out_dict(WorkflowRunOut, run))
 
 
 @router.get("/{workflow_id}/runs", response_model=list[WorkflowRunOut])
 def list_runs(workflow_id: str, limit: int = 20, user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    wf = db.query(Workflow).filter(Workflow.id == workflow_id, Workflow.user_id == user.id).first()
-    if not wf:
+    if db.execute(WORKFLOW_EXISTS, {"workflow_id": workflow_id, "user_id": user.id}).first() is None:
         raise HTTPException(status_code=404, detail="Workflow not found")
 
-    runs = (
-        db.query(WorkflowRun)
-        .filter(WorkflowRun.workflow_id == workflow_id)
-        .order_by(WorkflowRun.created_at.desc())
-        .limit(limit)
-        .all()
-    )
-    return [WorkflowRunOut.model_validate(r) for r in runs]
+    rows = db.execute(LIST_RUNS, {"workflow_id": workflow_id, "limit": limit}).mappings()
+    return ORJSONResponse([dict(r) for r in rows])
@@ -15,6 +15,7 @@ def start_scheduler() -> None:
     _scheduler = BackgroundScheduler(timezone="UTC")
     _scheduler.start()
     _reload_scheduled_workflows()
+    _schedule_usage_reconcile()
     logger.info("APScheduler started")
 
 
@@ -48,6 +49,18 @@ def _reload_scheduled_workflows() -> None:
         logger.warning(f"Could not load scheduled workflows: {e}")
 
 
+def _schedule_usage_reconcile() -> None:
+    """Nightly: settle the Redis run counters onto users.runs_this_month."""
+    from app.services.usage_service import reconcile_run_counters
+    _scheduler.add_job(
+        reconcile_run_counters,
+        trigger=CronTrigger(hour=3, minute=0),
+        id="usage_reconcile",
+        replace_existing=True,
+        misfire_grace_time=3600,
+    )
+
+
 def schedule_workflow(workflow_id: str, cron_expr: str) -> None:
     """Add or replace a scheduled job for a workflow."""
     global _scheduler
@@ -92,9 +105,12 @@ def unschedule_workflow(workflow_id: str) -> None:
 def _run_scheduled_workflow(workflow_id: str) -> None:
     """Execute a workflow from the scheduler (runs in background thread)."""
     from app.db import SessionLocal
-    from app.models import Workflow, WorkflowRun, AgentDef, UsageRecord
+    from app.models import User, Workflow, WorkflowRun, UsageRecord
+    from app.services.agent_def_service import resolve_agent_defs
     from app.workflows.engine import WorkflowEngine
     from app.services.email_service import send_workflow_notification
+    from app.services.usage_service import add_usage
+    from app.auth import invalidate_user_cache
 
     db = SessionLocal()
     try:
@@ -103,9 +119,7 @@ def _run_scheduled_workflow(workflow_id: str) -> None:
             return
 
         # Load agent defs
-        agent_def_ids = [n.get("agent_def_id", "") for n in wf.graph.get("nodes", []) if n.get("agent_def_id")]
-        agent_defs_db = db.query(AgentDef).filter(AgentDef.id.in_(agent_def_ids)).all() if agent_def_ids else []
-        agent_defs = {ad.id: {"agent_type": ad.agent_type, "config": ad.config} for ad in agent_defs_db}
+        agent_defs = resolve_agent_defs(db, wf)
 
         run = WorkflowRun(
             workflow_id=wf.id,
@@ -116,7 +130,7 @@ def _run_scheduled_workflow(workflow_id: str) -> None:
         db.add(run)
         db.commit()
 
-        engine = WorkflowEngine(graph=wf.graph, agent_defs=agent_defs)
+        engine = WorkflowEngine(graph=wf.graph, agent_defs=agent_defs, owner_id=wf.user_id)
         result = engine.run(input_data={})
 
         run.status = result["status"]
@@ -136,12 +150,14 @@ def _run_scheduled_workflow(workflow_id: str) -> None:
             cost_usd=result["total_cost_usd"],
         )
         db.add(usage)
+        add_usage(db, wf.user_id, result["total_tokens"], result["total_cost_usd"])
         db.commit()
+        invalidate_user_cache(wf.user_id)
 
         logger.info(f"Scheduled run for workflow {workflow_id} completed: {result['status']}")
 
         # Send email notification if configured
-        user = wf.user
+        user = db.get(User, wf.user_id)
         if user:
             import asyncio
             asyncio.run(send_workflow_notification(
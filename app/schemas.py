@@ -4,6 +4,15 @@ from typing import Optional, Any
 from datetime import datetime
 
 
+def out_dict(model_cls: type[BaseModel], obj: Any) -> dict:
+    """An Out schema's fields read off an ORM row, as a plain dict for ORJSONResponse.
+
+    No model instance and no validation: only for rows we wrote ourselves. The Out class
+    stays the route's response_model for the OpenAPI docs.
+    """
+    return {name: getattr(obj, name) for name in model_cls.model_fields}
+
+
 # --- Auth ---
 class UserRegister(BaseModel):
     email: EmailStr
@@ -74,6 +83,12 @@ class WorkflowGraph(BaseModel):
     nodes: list[WorkflowNode] = []
     edges: list[WorkflowEdge] = []
 
+    def stored(self) -> dict:
+        """The graph as saved on Workflow.graph, with the referenced agent_def ids precomputed for runs."""
+        graph = self.model_dump()
+        graph["_agent_def_ids"] = sorted({n.agent_def_id for n in self.nodes if n.agent_def_id})
+        return graph
+
 
 class WorkflowCreate(BaseModel):
     name: str
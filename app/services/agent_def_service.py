@@ -0,0 +1,43 @@
+"""Agent definition lookup for workflow runs - cached per workflow version."""
+from __future__ import annotations
+import threading
+
+import cachetools
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import AgentDef, Workflow
+
+# (workflow id, updated_at) -> {agent_def_id: {agent_type, config}}. Editing the workflow
+# changes the key; editing an AgentDef clears the cache here, and the TTL bounds how long
+# other worker processes can serve a stale config.
+_CACHE: cachetools.TTLCache = cachetools.TTLCache(maxsize=1024, ttl=300)
+_LOCK = threading.Lock()
+
+
+def resolve_agent_defs(db: Session, wf: Workflow) -> dict:
+    """The agent definitions referenced by a workflow's nodes, keyed by id."""
+    key = (wf.id, wf.updated_at)
+    with _LOCK:
+        cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    agent_def_ids = wf.graph.get("_agent_def_ids")
+    if agent_def_ids is None:  # saved before the ids were precomputed on write
+        agent_def_ids = [n.get("agent_def_id", "") for n in wf.graph.get("nodes", []) if n.get("agent_def_id")]
+    agent_defs = {}
+    if agent_def_ids:
+        rows = db.execute(
+            select(AgentDef.id, AgentDef.agent_type, AgentDef.config).where(AgentDef.id.in_(agent_def_ids))
+        )
+        agent_defs = {row.id: {"agent_type": row.agent_type, "config": row.config} for row in rows}
+    with _LOCK:
+        _CACHE[key] = agent_defs
+    return agent_defs
+
+
+def invalidate_agent_defs() -> None:
+    """Call after an AgentDef is updated or deleted; any cached workflow may reference it."""
+    with _LOCK:
+        _CACHE.clear()
@@ -0,0 +1,204 @@
+"""Monthly run counters - kept in Redis so limit checks and run accounting skip the users row."""
+from __future__ import annotations
+import logging
+from datetime import datetime, timezone
+
+import redis
+from sqlalchemy import bindparam, case, func, or_, update
+from sqlalchemy.orm import Session
+
+from app.models import User, UsageRecord, WorkflowRun
+from app.redis_client import get_redis, mark_unavailable
+
+logger = logging.getLogger(__name__)
+
+# Outlives the month it counts; the next month uses a new key
+COUNTER_TTL = 40 * 86400
+
+
+def _month(now: datetime | None = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m")
+
+
+def _key(user_id: str, month: str | None = None) -> str:
+    return f"usage:{user_id}:{month or _month()}"
+
+
+def _month_start() -> datetime:
+    """00:00 UTC on the 1st, naive like the stored created_at values."""
+    return datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+
+
+def _count_manual_runs(db: Session, user_id: str) -> int:
+    """Rebuild the counter from Postgres: manual runs recorded since the 1st of the month."""
+    return (
+        db.query(func.count(UsageRecord.id))
+        .join(WorkflowRun, WorkflowRun.id == UsageRecord.workflow_run_id)
+        .filter(
+            UsageRecord.user_id == user_id,
+            UsageRecord.created_at >= _month_start(),
+            WorkflowRun.trigger == "manual",
+        )
+        .scalar()
+    ) or 0
+
+
+def _count_manual_runs_by_user(db: Session) -> dict[str, int]:
+    """_count_manual_runs for every user with a run this month, in one query."""
+    rows = (
+        db.query(UsageRecord.user_id, func.count(UsageRecord.id))
+        .join(WorkflowRun, WorkflowRun.id == UsageRecord.workflow_run_id)
+        .filter(UsageRecord.created_at >= _month_start(), WorkflowRun.trigger == "manual")
+        .group_by(UsageRecord.user_id)
+    )
+    return dict(rows.all())
+
+
+def _seed(r: redis.Redis, db: Session, user_id: str, key: str) -> int:
+    count = _count_manual_runs(db, user_id)
+    # NX: a concurrent request may have seeded (and incremented) first
+    if not r.set(key, count, ex=COUNTER_TTL, nx=True):
+        return int(r.get(key) or count)
+    return count
+
+
+def get_runs_this_month(user: User, db: Session | None = None) -> int:
+    """Runs used this month; falls back to users.runs_this_month when Redis is unavailable."""
+    r = get_redis()
+    if r is None:
+        return user.runs_this_month
+    key = _key(user.id)
+    try:
+        count = r.get(key)
+        if count is not None:
+            return int(count)
+        if db is None:
+            return user.runs_this_month
+        return _seed(r, db, user.id, key)
+    except redis.RedisError as e:
+        mark_unavailable(e)
+        return user.runs_this_month
+
+
+def record_run(db: Session, user: User) -> None:
+    """Count a manual run when it is accepted, before it has a UsageRecord; the caller commits.
+
+    Counting up front means runs still in flight count toward the next limit check.
+    """
+    r = get_redis()
+    if r is not None:
+        key = _key(user.id)
+        try:
+            if not r.exists(key):
+                _seed(r, db, user.id, key)  # finished runs; this one isn't recorded yet
+            pipe = r.pipeline()
+            pipe.incr(key)
+            pipe.expire(key, COUNTER_TTL)
+            pipe.execute()
+            return
+        except redis.RedisError as e:
+            mark_unavailable(e)
+    # Atomic, so concurrent fallback runs can't lose increments; the nightly reconcile
+    # carries these runs over to the Redis counter
+    db.execute(update(User).where(User.id == user.id).values(runs_this_month=User.runs_this_month + 1))
+
+
+def release_run(db: Session, user_id: str) -> None:
+    """Give back a run counted by record_run that never produced a result; the caller commits."""
+    r = get_redis()
+    if r is not None:
+        key = _key(user_id)
+        try:
+            if r.exists(key):
+                r.decr(key)
+            return
+        except redis.RedisError as e:
+            mark_unavailable(e)
+    db.execute(
+        update(User)
+        .where(User.id == user_id, User.runs_this_month > 0)
+        .values(runs_this_month=User.runs_this_month - 1)
+    )
+
+
+def add_usage(db: Session, user_id: str, tokens: int, cost: float) -> None:
+    """Add a run's tokens/cost to the user's monthly totals; the first run of a month restarts them.
+
+    A single atomic UPDATE in the caller's transaction, so concurrent runs can't lose increments.
+    """
+    month_start = _month_start()
+    stale = or_(User.usage_period_start.is_(None), User.usage_period_start < month_start)
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            tokens_this_month=case((stale, tokens), else_=User.tokens_this_month + tokens),
+            cost_usd_this_month=case((stale, cost), else_=User.cost_usd_this_month + cost),
+            usage_period_start=month_start,
+        )
+    )
+
+
+def get_month_totals(user: User) -> tuple[int, float]:
+    """(tokens, cost) for this month, read off the user row; zero if the last run was in an earlier month."""
+    if user.usage_period_start is None or user.usage_period_start < _month_start():
+        return 0, 0.0
+    return user.tokens_this_month, user.cost_usd_this_month
+
+
+def reconcile_run_counters() -> int:
+    """Settle this month's Redis counters with Postgres. Returns counters settled.
+
+    Each counter becomes the larger of its Redis value and the runs Postgres recorded, and
+    is copied onto users.runs_this_month. Postgres is ahead when runs were recorded while
+    Redis was down (they only reached the users row); the difference is added back to Redis
+    so the limit check sees them.
+    """
+    r = get_redis()
+    if r is None:
+        return 0
+    from app.db import SessionLocal
+
+    month = _month()
+    try:
+        keys = list(r.scan_iter(match=_key("*", month), count=1000))
+        values = r.mget(keys) if keys else []
+    except redis.RedisError as e:
+        mark_unavailable(e)
+        return 0
+
+    counters = {key: int(value) for key, value in zip(keys, values) if value is not None}
+    if not counters:
+        return 0
+    # Core executemany: keys for since-deleted users just match no row
+    stmt = (
+        update(User.__table__)
+        .where(User.__table__.c.id == bindparam("user_id"))
+        .values(runs_this_month=bindparam("runs"))
+    )
+    db = SessionLocal()
+    try:
+        recorded = _count_manual_runs_by_user(db)
+        rows = []
+        missed: dict[str, int] = {}
+        for key, runs in counters.items():
+            user_id = key.split(":")[1]
+            behind = recorded.get(user_id, 0) - runs
+            if behind > 0:
+                missed[key] = behind
+            rows.append({"user_id": user_id, "runs": runs + max(behind, 0)})
+        if missed:
+            try:
+                pipe = r.pipeline()
+                for key, behind in missed.items():
+                    pipe.incrby(key, behind)
+                pipe.execute()
+            except redis.RedisError as e:
+                mark_unavailable(e)
+                return 0
+        db.execute(stmt, rows)
+        db.commit()
+    finally:
+        db.close()
+    logger.info(f"Reconciled {len(rows)} run counters for {month}")
+    return len(rows)
@@ -1,190 +1,329 @@
 """Workflow Execution Engine - the core orchestrator.
 
 Executes a workflow graph by:
-1. Topologically sorting nodes based on edges
-2. Running each node's agent with context from upstream nodes
-3. Handling conditional branching
+1. Scheduling nodes in topological waves based on edges
+2. Running each wave's agents concurrently, with context from upstream nodes
+3. Handling conditional branching (pruning untaken branches as it goes)
 4. Tracking results, tokens, and costs per node
 """
+import asyncio
+import functools
 import time
-from datetime import datetime, timezone
-from collections import defaultdict, deque
+from types import MappingProxyType
+from typing import AsyncIterator, Mapping, NamedTuple
 from app.agents.registry import get_agent
-from app.agents.base import AgentResult
+from app.agents.base import AgentResult, BaseAgent
+from app.agents.clients import close_async_client
+
+# Cap on nodes of one wave running at once (each may hold a thread or an HTTP connection)
+DEFAULT_MAX_PARALLEL = 10
+
+# node_results entry for nodes pruned by a conditional; shared, never mutated
+_SKIPPED = {"status": "skipped", "output": None, "duration_ms": 0}
+
+
+def _error_entry(message: str, duration_ms: int) -> dict:
+    """node_results entry for a node that raised instead of returning a result."""
+    return {"status": "error", "output": message, "duration_ms": duration_ms}
+
+
+class GraphPlan(NamedTuple):
+    """Structure of a graph, independent of node configs; shared by every run of that shape."""
+    succ: Mapping[str, tuple[tuple[str, str], ...]]  # source -> ((target, condition), ...)
+    pred: Mapping[str, tuple[str, ...]]  # target -> (source, ...)
+    in_degree: Mapping[str, int]  # upstream node count, before anything runs
+    out_degree: Mapping[str, int]  # downstream node count; only nodes that have any
+    roots: tuple[str, ...]  # the first wave
+    sinks: tuple[str, ...]  # nodes with no outgoing edges; the workflow's output comes from one of these
+
+
+def compile_graph(graph: dict) -> GraphPlan:
+    """The graph's plan, reused across runs of any graph with the same nodes and edges."""
+    node_ids = tuple(n["id"] for n in graph.get("nodes", []))
+    edges = tuple(
+        (e["source_id"], e["target_id"], e.get("condition", "true"))
+        for e in graph.get("edges", [])
+    )
+    return _compile(node_ids, edges)
+
+
+# Shared empty mapping: the default for missing edge indexes and configs; read-only
+_EMPTY: Mapping = MappingProxyType({})
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(node_ids: tuple[str, ...], edges: tuple[tuple[str, str, str], ...]) -> GraphPlan:
+    if not edges:
+        # Fast path for flat graphs: one wave of every node, nothing to index
+        return GraphPlan(_EMPTY, _EMPTY, MappingProxyType(dict.fromkeys(node_ids, 0)), _EMPTY, node_ids, node_ids)
+
+    # Prefilled per node: the key checks double as the known-node check
+    succ: dict[str, list[tuple[str, str]]] = {node_id: [] for node_id in node_ids}
+    pred: dict[str, list[str]] = {node_id: [] for node_id in node_ids}
+    for src, tgt, condition in edges:
+        # Edges to or from missing nodes can never fire
+        if src in succ and tgt in pred:
+            succ[src].append((tgt, condition))
+            pred[tgt].append(src)
+    # The indexes keep only nodes that have edges, in insertion order
+    return GraphPlan(
+        succ=MappingProxyType({k: tuple(v) for k, v in succ.items() if v}),
+        pred=MappingProxyType({k: tuple(v) for k, v in pred.items() if v}),
+        in_degree=MappingProxyType({k: len(v) for k, v in pred.items()}),
+        out_degree=MappingProxyType({k: len(v) for k, v in succ.items() if v}),
+        roots=tuple(k for k, v in pred.items() if not v),
+        sinks=tuple(k for k, v in succ.items() if not v),
+    )
+
+
+class CompiledNode(NamedTuple):
+    """A node with its agent definition resolved and its agent built, ready to run."""
+    agent_type: str
+    agent: BaseAgent | None
+    error: Exception | None  # why the agent couldn't be built (e.g. unknown type); reported when the node runs
+    objective: str
+    stop_on_failure: bool
+    branches: bool  # a conditional: its output picks which outgoing edges stay live
 
 
 class WorkflowEngine:
     """Executes a workflow graph."""
 
-    def __init__(self, graph: dict, agent_defs: dict[str, dict] | None = None):
+    def __init__(
+        self, graph: dict, agent_defs: dict[str, dict] | None = None,
+        max_parallel: int = DEFAULT_MAX_PARALLEL, owner_id: str | None = None,
+    ):
         """
         Args:
             graph: {"nodes": [...], "edges": [...]}
             agent_defs: {agent_def_id: {agent_type, config, ...}} lookup
+            max_parallel: most nodes of one wave executing concurrently
+            owner_id: the user the workflow runs for, passed on to its agents
         """
         self.nodes = {n["id"]: n for n in graph.get("nodes", [])}
         self.edges = graph.get("edges", [])
+        # Edge indexes come from the shared plan cache: repeat runs of a graph skip rebuilding them
+        self.plan = compile_graph(graph)
         self.agent_defs = agent_defs or {}
+        self.owner_id = owner_id
+        # Definition lookup, config merge and agent construction, once per node up front
+        self.compiled = {node_id: self._compile_node(node) for node_id, node in self.nodes.items()}
+        self.max_parallel = max_parallel
         self.results: dict[str, dict] = {}
         self.total_tokens = 0
         self.total_cost = 0.0
+        self.start_ns: int | None = None  # set when the run starts
 
     def run(self, input_data: dict | None = None) -> dict:
-        """Execute the full workflow.
+        """Execute the full workflow from synchronous code (a worker thread, not an event loop).
 
         Returns:
             {status, node_results, output_data, total_tokens, total_cost_usd, duration_ms}
         """
-        start = time.time()
-        execution_order = self._topological_sort()
-        skipped_nodes: set[str] = set()
+        return asyncio.run(self._run_in_own_loop(input_data))
+
+    async def _run_in_own_loop(self, input_data: dict | None) -> dict:
+        try:
+            return await self.run_async(input_data)
+        finally:
+            # The loop ends with this run; don't leave its pooled connections behind
+            await close_async_client()
+
+    async def run_async(self, input_data: dict | None = None) -> dict:
+        """Execute the workflow wave by wave: every node whose upstream nodes have all
+        finished runs concurrently with the rest of its wave, so a wave takes as long
+        as its slowest node rather than the sum of them.
+        """
+        async for event in self.stream_run(input_data):
+            pass
+        return event["result"]
 
-        # Initialize context with input data
-        context_store: dict[str, dict] = {}
-        if input_data:
-            context_store["__input__"] = input_data
-
-        for node_id in execution_order:
-            if node_id in skipped_nodes:
-                self.results[node_id] = {"status": "skipped", "output": None, "duration_ms": 0}
-                continue
-
-            node = self.nodes[node_id]
-            node_start = time.time()
-
-            # Build context from upstream nodes
-            upstream_context = self._gather_context(node_id, context_store, input_data)
-
-            # Get agent definition
-            agent_def_id = node.get("agent_def_id", "")
-            agent_def = self.agent_defs.get(agent_def_id, {})
-            agent_type = node.get("agent_type") or agent_def.get("agent_type", "llm")
-
-            # Merge configs: agent_def defaults + node overrides
-            config = {**agent_def.get("config", {}), **node.get("config_overrides", {})}
-            objective = node.get("objective", config.get("objective", ""))
-
-            try:
-                agent = get_agent(agent_type, config=config)
-                result: AgentResult = agent.run(objective, context=upstream_context)
-
-                self.results[node_id] = {
-                    "status": "completed" if result.success else "failed",
-                    "output": result.output,
-                    "tokens_used": result.tokens_used,
-                    "cost_usd": result.cost_usd,
-                    "duration_ms": result.duration_ms,
-                    "metadata": result.metadata,
-                }
-
-                self.total_tokens += result.tokens_used
-                self.total_cost += result.cost_usd
-
-                # Store output in context for downstream nodes
-                context_store[node_id] = (
-                    result.output if isinstance(result.output, dict)
-                    else {"output": result.output}
-                )
-
-                # Handle conditional branching
-                if agent_type == "conditional" and isinstance(result.output, dict):
-                    branch = result.output.get("branch", "true")
-                    skipped = self._get_skipped_branches(node_id, branch)
-                    skipped_nodes.update(skipped)
-
-                # Stop on failure if configured
-                if not result.success and node.get("stop_on_failure", True):
-                    self.results[node_id]["status"] = "failed"
-                    return self._build_result("failed", start, node_id)
-
-            except Exception as e:
-                self.results[node_id] = {
-                    "status": "error",
-                    "output": str(e),
-                    "duration_ms": int((time.time() - node_start) * 1000),
-                }
-                if node.get("stop_on_failure", True):
-                    return self._build_result("failed", start, node_id)
-
-        return self._build_result("completed", start)
-
-    def _topological_sort(self) -> list[str]:
-        """Sort nodes in execution order respecting edges."""
-        in_degree: dict[str, int] = defaultdict(int)
-        adjacency: dict[str, list[str]] = defaultdict(list)
-
-        for node_id in self.nodes:
-            in_degree.setdefault(node_id, 0)
-
-        for edge in self.edges:
-            src = edge["source_id"]
-            tgt = edge["target_id"]
-            adjacency[src].append(tgt)
-            in_degree[tgt] += 1
-
-        queue = deque([n for n in self.nodes if in_degree[n] == 0])
-        order = []
-
-        while queue:
-            node = queue.popleft()
-            order.append(node)
-            for neighbor in adjacency[node]:
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
-
-        return order
-
-    def _gather_context(self, node_id: str, context_store: dict, input_data: dict | None) -> dict:
-        """Collect outputs from all upstream nodes as context."""
-        upstream = {}
+    async def stream_run(self, input_data: dict | None = None) -> AsyncIterator[dict]:
+        """Execute the workflow like run_async, yielding progress as it goes.
 
-        # Include original input
-        if input_data:
-            upstream["input"] = input_data
+        After each wave, one {"type": "node_complete", "node_id", "result"} per node that
+        finished or was skipped in it, then a final {"type": "run_complete", "result"}
+        carrying what run_async returns. Closing the generator early stops the run before
+        its next wave.
+        """
+        self.start_ns = time.perf_counter_ns()  # monotonic, integer: durations immune to clock steps
+        semaphore = asyncio.Semaphore(self.max_parallel)
 
-        # Find all edges targeting this node
-        for edge in self.edges:
-            if edge["target_id"] == node_id:
-                src = edge["source_id"]
-                if src in context_store:
-                    upstream[src] = context_store[src]
+        # Outputs downstream nodes still have to read, each dropped once its last consumer
+        # has run or been skipped (node_results keeps every output for the run record)
+        context_store: dict[str, dict] = {}
+        consumers = dict(self.plan.out_degree)
+
+        # Kahn's algorithm, run live: in_degree counts unfinished upstream nodes, live_in the
+        # incoming edges that weren't pruned by a conditional
+        in_degree = dict(self.plan.in_degree)
+        live_in = dict.fromkeys(self.nodes, 0)
+        wave = list(self.plan.roots)
+
+        while wave:
+            outcomes = await asyncio.gather(
+                *(self._run_node(node_id, context_store, input_data, semaphore) for node_id in wave)
+            )
+
+            # Fold results in wave order, so totals and node_results don't depend on finish order
+            next_wave: list[str] = []
+            recorded: list[str] = []  # this wave's nodes and the skips they caused, in recording order
+            failed_node = None
+            for node_id, (result, entry) in zip(wave, outcomes):
+                self.results[node_id] = entry
+                recorded.append(node_id)
+                compiled = self.compiled[node_id]
+                taken_branch = None
+                if result is not None:
+                    self.total_tokens += result.tokens_used
+                    self.total_cost += result.cost_usd
+
+                    # Store output in context for downstream nodes, if it has any
+                    if node_id in consumers:
+                        context_store[node_id] = (
+                            result.output if isinstance(result.output, dict)
+                            else {"output": result.output}
+                        )
+
+                    # Handle conditional branching
+                    if compiled.branches and isinstance(result.output, dict):
+                        taken_branch = result.output.get("branch", "true")
+
+                # Stop on failure (a failed result or a raised error) if configured
+                if compiled.stop_on_failure and (result is None or not result.success):
+                    failed_node = failed_node or node_id
+
+                self._release(node_id, taken_branch, in_degree, live_in, next_wave, recorded)
+
+            for node_id in recorded:
+                for src in self.plan.pred.get(node_id, ()):
+                    consumers[src] -= 1
+                    if not consumers[src]:
+                        context_store.pop(src, None)
+                yield {"type": "node_complete", "node_id": node_id, "result": self.results[node_id]}
+
+            # Siblings of a failed node already ran and are recorded above; nothing after this wave starts
+            if failed_node:
+                yield {"type": "run_complete", "result": self._build_result("failed", failed_node)}
+                return
+            wave = next_wave
+
+        yield {"type": "run_complete", "result": self._build_result("completed")}
+
+    def _release(
+        self, node_id: str, taken_branch: str | None, in_degree: dict, live_in: dict,
+        ready: list[str], skipped: list[str],
+    ) -> None:
+        """Mark node_id finished for its successors, queueing those that become ready
+        and recording (in results and skipped) those that never will.
+
+        Edges off a conditional's untaken branch are dead. A node whose incoming edges are
+        all dead is skipped without entering the ready queue, and finishes (with dead edges)
+        for its own successors in turn, so a join still runs if any live path reaches it.
+        Each dead edge is walked once per run, so pruning needs no precomputed descendant
+        sets (which would also wrongly skip joins that are reachable from the taken branch).
+        """
+        stack = [(node_id, taken_branch, False)]
+        while stack:
+            source, branch, dead = stack.pop()
+            for target, condition in self.plan.succ.get(source, ()):
+                if not dead and (branch is None or condition == branch):
+                    live_in[target] += 1
+                in_degree[target] -= 1
+                if in_degree[target] == 0:
+                    if live_in[target]:
+                        ready.append(target)
+                    else:
+                        self.results[target] = _SKIPPED
+                        skipped.append(target)
+                        stack.append((target, None, True))
+
+    def _compile_node(self, node: dict) -> CompiledNode:
+        # Get agent definition
+        agent_def = self.agent_defs.get(node.get("agent_def_id", ""), {})
+        agent_type = node.get("agent_type") or agent_def.get("agent_type", "llm")
+
+        # Merge configs: agent_def defaults + node overrides
+        # Always a fresh dict (| copies), so the agent may keep it without aliasing either side
+        config = agent_def.get("config", _EMPTY) | node.get("config_overrides", _EMPTY)
+        objective = node.get("objective", config.get("objective", ""))
+
+        agent = error = None
+        try:
+            agent = get_agent(agent_type, config=config, owner_id=self.owner_id)
+        except Exception as e:
+            error = e
+        return CompiledNode(
+            agent_type, agent, error, objective, node.get("stop_on_failure", True), agent_type == "conditional",
+        )
+
+    async def _run_node(
+        self, node_id: str, context_store: dict, input_data: dict | None, semaphore: asyncio.Semaphore,
+    ) -> tuple[AgentResult | None, dict]:
+        """Run one node; returns (result or None if it raised, node_results entry)."""
+        compiled = self.compiled[node_id]
+        node_start_ns = time.perf_counter_ns()
+
+        # Build context from upstream nodes; a root has none, only the workflow input
+        preds = self.plan.pred.get(node_id)
+        if preds:
+            upstream_context = self._gather_context(preds, context_store, input_data)
+        else:
+            upstream_context = {"input": input_data} if input_data else {}
+
+        try:
+            if compiled.error is not None:
+                raise compiled.error
+            # arun: native async I/O where the agent has it, else its blocking run() in a thread
+            async with semaphore:
+                result: AgentResult = await compiled.agent.arun(compiled.objective, context=upstream_context)
+        except Exception as e:
+            return None, _error_entry(str(e), (time.perf_counter_ns() - node_start_ns) // 1_000_000)
+
+        return result, {
+            "status": "completed" if result.success else "failed",
+            "output": result.output,
+            "tokens_used": result.tokens_used,
+            "cost_usd": result.cost_usd,
+            "duration_ms": result.duration_ms,
+            "metadata": result.metadata,
+        }
+
+    def _gather_context(self, preds: tuple[str, ...], context_store: dict, input_data: dict | None) -> dict:
+        """Collect outputs of the given upstream nodes as context.
 
+        A plain dict of |pred| + 1 references, not a view over context_store: agents pickle
+        it (code_exec), JSON-encode it (llm) or return it as their output (passthrough), and a
+        view would drag the whole store along or fail to serialize.
+        """
+        # Include original input
+        upstream = {"input": input_data} if input_data else {}
+        for src in preds:
+            output = context_store.get(src)  # absent if src was skipped or raised
+            if output is not None:
+                upstream[src] = output
         return upstream
 
-    def _get_skipped_branches(self, conditional_node_id: str, taken_branch: str) -> set[str]:
-        """For conditional nodes, determine which downstream nodes to skip."""
-        skipped = set()
-        for edge in self.edges:
-            if edge["source_id"] == conditional_node_id:
-                edge_branch = edge.get("condition", "true")
-                if edge_branch != taken_branch:
-                    # Skip this branch and all its descendants
-                    skipped.add(edge["target_id"])
-                    skipped.update(self._get_all_descendants(edge["target_id"]))
-        return skipped
-
-    def _get_all_descendants(self, node_id: str) -> set[str]:
-        """Get all nodes downstream of a given node."""
-        descendants = set()
-        queue = deque([node_id])
-        while queue:
-            current = queue.popleft()
-            for edge in self.edges:
-                if edge["source_id"] == current and edge["target_id"] not in descendants:
-                    descendants.add(edge["target_id"])
-                    queue.append(edge["target_id"])
-        return descendants
-
-    def _build_result(self, status: str, start: float, failed_node: str | None = None) -> dict:
+    def partial_result(self) -> dict:
+        """The result of a run stopped part-way (e.g. its stream was closed), as a failed run:
+        the nodes that finished, and their tokens and cost."""
+        return self._build_result("failed")
+
+    def _build_result(self, status: str, failed_node: str | None = None) -> dict:
         """Build the final execution result."""
-        # Find the last completed node's output as the workflow output
+        # The workflow output is the last completed sink; if none completed (e.g. a failure
+        # exit), the most recently completed node
         output = None
-        for node_id in reversed(list(self.results.keys())):
-            r = self.results[node_id]
-            if r.get("status") == "completed":
+        for node_id in reversed(self.plan.sinks):
+            r = self.results.get(node_id)
+            if r is not None and r.get("status") == "completed":
                 output = r.get("output")
                 break
+        else:
+            for r in reversed(self.results.values()):
+                if r.get("status") == "completed":
+                    output = r.get("output")
+                    break
 
         return {
             "status": status,
@@ -192,6 +331,6 @@ class WorkflowEngine:
             "output_data": output,
             "total_tokens": self.total_tokens,
             "total_cost_usd": round(self.total_cost, 6),
-            "duration_ms": int((time.time() - start) * 1000),
+            "duration_ms": (time.perf_counter_ns() - self.start_ns) // 1_000_000 if self.start_ns else 0,
             "failed_node": failed_node,
         }
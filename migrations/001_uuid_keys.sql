@@ -0,0 +1,33 @@
+-- Convert VARCHAR(36) id/foreign-key columns to native uuid (16 bytes).
+-- Postgres only; run once against an existing database before deploying the new models.
+-- Fresh databases get these types from init_db() and need nothing here.
+BEGIN;
+
+ALTER TABLE agent_defs DROP CONSTRAINT IF EXISTS agent_defs_user_id_fkey;
+ALTER TABLE workflows DROP CONSTRAINT IF EXISTS workflows_user_id_fkey;
+ALTER TABLE workflow_runs DROP CONSTRAINT IF EXISTS workflow_runs_workflow_id_fkey;
+ALTER TABLE usage_records DROP CONSTRAINT IF EXISTS usage_records_user_id_fkey;
+ALTER TABLE usage_records DROP CONSTRAINT IF EXISTS usage_records_workflow_run_id_fkey;
+
+ALTER TABLE users ALTER COLUMN id TYPE uuid USING id::uuid;
+ALTER TABLE agent_defs
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN user_id TYPE uuid USING user_id::uuid;
+ALTER TABLE workflows
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN user_id TYPE uuid USING user_id::uuid;
+ALTER TABLE workflow_runs
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN workflow_id TYPE uuid USING workflow_id::uuid;
+ALTER TABLE usage_records
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN user_id TYPE uuid USING user_id::uuid,
+    ALTER COLUMN workflow_run_id TYPE uuid USING workflow_run_id::uuid;
+
+ALTER TABLE agent_defs ADD CONSTRAINT agent_defs_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id);
+ALTER TABLE workflows ADD CONSTRAINT workflows_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id);
+ALTER TABLE workflow_runs ADD CONSTRAINT workflow_runs_workflow_id_fkey FOREIGN KEY (workflow_id) REFERENCES workflows (id);
+ALTER TABLE usage_records ADD CONSTRAINT usage_records_user_id_fkey FOREIGN KEY (user_id) REFERENCES users (id);
+ALTER TABLE usage_records ADD CONSTRAINT usage_records_workflow_run_id_fkey FOREIGN KEY (workflow_run_id) REFERENCES workflow_runs (id);
+
+COMMIT;
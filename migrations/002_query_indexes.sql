@@ -0,0 +1,9 @@
+-- Composite indexes matching the list queries' WHERE + ORDER BY, plus the Stripe webhook lookup.
+-- Postgres only. CONCURRENTLY avoids locking writes, so run outside a transaction (plain psql -f is fine).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_workflows_user_updated ON workflows (user_id, updated_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_workflow_runs_workflow_created ON workflow_runs (workflow_id, created_at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_stripe_subscription_id ON users (stripe_subscription_id);
+
+-- Superseded: both are prefixes of a composite index
+DROP INDEX CONCURRENTLY IF EXISTS ix_workflow_runs_workflow_id;
+DROP INDEX CONCURRENTLY IF EXISTS ix_usage_records_user_id;
@@ -0,0 +1,22 @@
+-- Monthly token/cost running totals on users, replacing the SUM over usage_records in /billing/usage.
+-- Postgres only; backfills the current month from usage_records.
+BEGIN;
+
+ALTER TABLE users
+    ADD COLUMN IF NOT EXISTS tokens_this_month integer NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS cost_usd_this_month double precision NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS usage_period_start timestamp;
+
+UPDATE users u
+SET tokens_this_month = t.tokens,
+    cost_usd_this_month = t.cost,
+    usage_period_start = date_trunc('month', now() AT TIME ZONE 'utc')
+FROM (
+    SELECT user_id, sum(tokens_used) AS tokens, sum(cost_usd) AS cost
+    FROM usage_records
+    WHERE created_at >= date_trunc('month', now() AT TIME ZONE 'utc')
+    GROUP BY user_id
+) t
+WHERE u.id = t.user_id;
+
+COMMIT;
@@ -0,0 +1,11 @@
+-- Covering index for the per-user monthly scans of usage_records (run-counter seed, usage backfill):
+-- the INCLUDE columns let Postgres answer them with an index-only scan instead of heap fetches.
+-- Postgres only. CONCURRENTLY avoids locking writes, so run outside a transaction (plain psql -f is fine).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_usage_user_covering
+    ON usage_records (user_id, created_at) INCLUDE (workflow_run_id, tokens_used, cost_usd);
+
+-- Superseded: same key columns without the payload
+DROP INDEX CONCURRENTLY IF EXISTS ix_usage_records_user_created;
+
+-- Keep the visibility map fresh so the planner can choose the index-only scan
+VACUUM (ANALYZE) usage_records;
@@ -0,0 +1,12 @@
+-- JSON document columns from json to jsonb (binary storage; no re-parse on read, GIN-indexable).
+-- Postgres only. Rewrites each table under an ACCESS EXCLUSIVE lock, so run in a maintenance window.
+BEGIN;
+
+ALTER TABLE agent_defs ALTER COLUMN config TYPE jsonb USING config::jsonb;
+ALTER TABLE workflows ALTER COLUMN graph TYPE jsonb USING graph::jsonb;
+ALTER TABLE workflow_runs
+    ALTER COLUMN input_data TYPE jsonb USING input_data::jsonb,
+    ALTER COLUMN output_data TYPE jsonb USING output_data::jsonb,
+    ALTER COLUMN node_results TYPE jsonb USING node_results::jsonb;
+
+COMMIT;
@@ -67,6 +67,73 @@ class TestWorkflowEngine:
         assert result["status"] == "completed"
         assert result["total_tokens"] == 0
 
+    def test_independent_nodes_run_concurrently(self):
+        import time
+        from app.agents.base import AgentResult, BaseAgent
+        from app.workflows.engine import WorkflowEngine
+
+        class SlowAgent(BaseAgent):
+            def run(self, objective, context=None):
+                time.sleep(0.2)
+                return AgentResult(success=True, output=objective, tokens_used=1)
+
+        nodes = [{"id": f"n{i}", "agent_type": "slow", "objective": f"n{i}"} for i in range(5)]
+        with patch.dict("app.agents.registry.AGENT_REGISTRY", {"slow": SlowAgent}):
+            start = time.time()
+            result = WorkflowEngine(graph={"nodes": nodes, "edges": []}).run(input_data={})
+            elapsed = time.time() - start
+
+        assert result["status"] == "completed"
+        assert result["total_tokens"] == 5
+        assert list(result["node_results"]) == [n["id"] for n in nodes]
+        assert elapsed < 0.8  # one wave, not five sequential sleeps
+
+    def test_pruned_branch_does_not_block_join(self):
+        from app.workflows.engine import WorkflowEngine
+        passthrough = {"agent_type": "data_transform", "config_overrides": {"operation": "passthrough"}}
+        graph = {
+            "nodes": [
+                {"id": "check", "agent_type": "conditional",
+                 "config_overrides": {"field": "input.flag", "operator": "eq", "value": "yes"}},
+                {"id": "then", **passthrough},
+                {"id": "else", **passthrough},
+                {"id": "else_more", **passthrough},
+                {"id": "join", **passthrough},
+            ],
+            "edges": [
+                {"source_id": "check", "target_id": "then", "condition": "true"},
+                {"source_id": "check", "target_id": "else", "condition": "false"},
+                {"source_id": "else", "target_id": "else_more"},
+                {"source_id": "then", "target_id": "join"},
+                {"source_id": "else_more", "target_id": "join"},
+            ],
+        }
+        result = WorkflowEngine(graph=graph).run(input_data={"flag": "yes"})
+        statuses = {node_id: r["status"] for node_id, r in result["node_results"].items()}
+        assert statuses == {
+            "check": "completed", "then": "completed",
+            "else": "skipped", "else_more": "skipped", "join": "completed",
+        }
+
+    def test_stream_run_yields_nodes_then_result(self):
+        import asyncio
+        from app.workflows.engine import WorkflowEngine
+        passthrough = {"agent_type": "data_transform", "config_overrides": {"operation": "passthrough"}}
+        graph = {
+            "nodes": [{"id": "a", **passthrough}, {"id": "b", **passthrough}],
+            "edges": [{"source_id": "a", "target_id": "b"}],
+        }
+
+        async def collect():
+            return [event async for event in WorkflowEngine(graph=graph).stream_run({"x": "1"})]
+
+        events = asyncio.run(collect())
+        assert [(e["type"], e.get("node_id")) for e in events] == [
+            ("node_complete", "a"), ("node_complete", "b"), ("run_complete", None),
+        ]
+        assert events[-1]["result"]["status"] == "completed"
+        assert events[-1]["result"]["output_data"] == events[1]["result"]["output"]
+
     def test_conditional_agent_true_branch(self):
         from app.agents.conditional_agent import ConditionalAgent
         agent = ConditionalAgent(config={
@@ -117,6 +184,16 @@ class TestWorkflowEngine:
         result = result_obj.output if hasattr(result_obj, "output") else result_obj
         assert result.get("result") == 10
 
+    def test_code_exec_cpu_limit(self):
+        from app.agents.code_exec_agent import CodeExecAgent
+        agent = CodeExecAgent(config={"code": "while True: pass", "timeout": 1})
+        result = agent.run("execute")
+        assert not result.success
+        assert "time limit" in result.output
+
+        # The pool keeps serving after a task hits its limit
+        assert CodeExecAgent(config={"code": "result = 6 * 7"}).run("execute").output == 42
+
 
 class TestAuth:
     """Test auth functions directly."""
@@ -171,3 +248,162 @@ class TestBillingLogic:
 
         # Should not raise for pro user
         check_usage_limit(user)
+
+
+class TestLLMAgent:
+    """Test LLM agent behavior without hitting a provider."""
+
+    def test_response_cache_hit(self):
+        from app.agents.base import AgentResult
+        from app.agents.llm_agent import LLMAgent
+
+        calls = []
+
+        def fake_call(self, messages, model, temperature, max_tokens, start):
+            calls.append(model)
+            return AgentResult(success=True, output="hello", tokens_used=12)
+
+        with patch("app.agents.llm_agent._provider", return_value="ollama"), \
+                patch.object(LLMAgent, "_call_ollama", fake_call):
+            agent = LLMAgent(config={"model": "cache-test-model", "temperature": 0})
+            first = agent.run("say hello")
+            second = agent.run("say hello")
+            bypass = LLMAgent(config={"model": "cache-test-model", "temperature": 0, "cache_bypass": True}).run("say hello")
+
+        assert first.output == second.output == bypass.output == "hello"
+        assert second.metadata["cache"] == "HIT"
+        assert second.tokens_used == 0
+        assert len(calls) == 2
+
+    def test_response_cache_scoped_to_owner_and_deterministic_calls(self):
+        from app.agents.base import AgentResult
+        from app.agents.llm_agent import LLMAgent
+
+        calls = []
+
+        def fake_call(self, messages, model, temperature, max_tokens, start):
+            calls.append(model)
+            return AgentResult(success=True, output="hello", tokens_used=12)
+
+        config = {"model": "scope-test-model", "temperature": 0}
+        with patch("app.agents.llm_agent._provider", return_value="ollama"), \
+                patch.object(LLMAgent, "_call_ollama", fake_call):
+            LLMAgent(config=config, owner_id="user-a").run("say hello")
+            other_tenant = LLMAgent(config=config, owner_id="user-b").run("say hello")
+            sampled = LLMAgent(config={"model": "scope-test-model"}, owner_id="user-a")
+            sampled.run("say hello")
+            sampled_again = sampled.run("say hello")
+            opted_in = LLMAgent(config={"model": "scope-test-model", "cache": True}, owner_id="user-a")
+            opted_in.run("say hello")
+            opted_in_again = opted_in.run("say hello")
+
+        assert "cache" not in other_tenant.metadata
+        assert "cache" not in sampled_again.metadata
+        assert opted_in_again.metadata["cache"] == "HIT"
+        assert len(calls) == 5  # both tenants, both sampled calls, the opted-in miss
+
+    def test_cancelled_leader_does_not_cancel_follower(self):
+        import asyncio
+        from app.agents.base import AgentResult
+        from app.agents.llm_agent import LLMAgent
+
+        calls = []
+
+        async def fake_acall(self, messages, model, temperature, max_tokens, start):
+            calls.append(model)
+            if len(calls) == 1:
+                await asyncio.sleep(10)  # the leader's call; cancelled below
+            return AgentResult(success=True, output="hello", tokens_used=12)
+
+        async def scenario():
+            agent = LLMAgent(config={"model": "inflight-test-model", "temperature": 0})
+            leader = asyncio.create_task(agent.arun("say hello"))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(agent.arun("say hello"))
+            await asyncio.sleep(0)
+            leader.cancel()
+            return await follower
+
+        with patch("app.agents.llm_agent._provider", return_value="ollama"), \
+                patch.object(LLMAgent, "_acall_ollama", fake_acall):
+            result = asyncio.run(scenario())
+
+        assert result.success and result.output == "hello"
+        assert len(calls) == 2
+
+    def test_openai_stream_counts_usage_and_forwards_chunks(self):
+        from types import SimpleNamespace
+        from app.agents import llm_agent
+        from app.agents.llm_agent import LLMAgent
+
+        def delta(text, finish_reason=None):
+            choice = SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)
+            return SimpleNamespace(choices=[choice], usage=None)
+
+        # include_usage: the totals arrive on a final chunk with no choices
+        usage = SimpleNamespace(total_tokens=30, prompt_tokens=10, completion_tokens=20)
+        chunks = [delta("Hel"), delta("lo"), delta(None, "stop"), SimpleNamespace(choices=[], usage=usage)]
+        client = MagicMock()
+        client.chat.completions.create.return_value = iter(chunks)
+
+        pieces = []
+        with patch("app.agents.llm_agent._provider", return_value="openai"), \
+                patch.object(llm_agent, "_OPENAI_CLIENT", client):
+            agent = LLMAgent(
+                config={"model": "gpt-4o-mini", "cache_bypass": True, "on_chunk": "not-callable"},
+                on_chunk=pieces.append,
+            )
+            result = agent.run("say hello")
+
+        assert result.success and result.output == "Hello"
+        assert pieces == ["Hel", "lo"]
+        assert result.tokens_used == 30
+        assert result.cost_usd == pytest.approx(10 * 0.00000015 + 20 * 0.0000006)
+        assert result.metadata["finish_reason"] == "stop"
+
+    def test_ollama_stream_parses_ndjson_and_fails_on_errors(self):
+        import json
+        import httpx
+        from app.agents import llm_agent
+        from app.agents.llm_agent import LLMAgent
+
+        bodies = {
+            "ok-model": (200, b'{"message":{"content":"Hel"}}\n{"message":{"content":"lo"}}\n'
+                              b'{"done":true,"eval_count":7}\n'),
+            "midstream-error-model": (200, b'{"message":{"content":"Hel"}}\n{"error":"out of memory"}\n'),
+            "missing-model": (404, b'{"error":"model not found"}'),
+        }
+
+        def handler(request):
+            status, body = bodies[json.loads(request.content)["model"]]
+            return httpx.Response(status, content=body)
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        with patch("app.agents.llm_agent._provider", return_value="ollama"), \
+                patch.object(llm_agent, "CLIENT", client):
+            ok = LLMAgent(config={"model": "ok-model", "temperature": 0}).run("say hello")
+            midstream = LLMAgent(config={"model": "midstream-error-model", "temperature": 0})
+            first_failure = midstream.run("say hello")
+            second_failure = midstream.run("say hello")
+            missing = LLMAgent(config={"model": "missing-model", "temperature": 0}).run("say hello")
+
+        assert ok.success and ok.output == "Hello" and ok.tokens_used == 7 and ok.cost_usd == 0.0
+        assert not first_failure.success and "out of memory" in first_failure.output
+        assert "cache" not in second_failure.metadata  # failures are never cached
+        assert not missing.success and "404" in missing.output and "model not found" in missing.output
+
+
+class TestAPICallAgent:
+    """Test request preparation for the API call agent."""
+
+    def test_interpolation_does_not_mutate_config(self):
+        from app.agents.api_call_agent import APICallAgent
+        agent = APICallAgent(config={
+            "url": "https://example.com/{{node-1}}?q={{missing}}",
+            "headers": {"X-Id": "{{node-1}}"},
+        })
+        method, url, kwargs = agent._prepare({"node-1": "abc"})
+        assert method == "GET"
+        assert url == "https://example.com/abc?q={{missing}}"
+        assert kwargs["headers"] == {"X-Id": "abc"}
+        assert agent.config["headers"] == {"X-Id": "{{node-1}}"}